@@ -8,6 +8,11 @@ final_networks_results_folder = f'{data_top_folder}/netw_results/final_runs'
 best_HPs_file = f'{data_top_folder}/final_eval/best_HPs.json'
 cache_folder = f'{data_top_folder}/cache_data/production'
 pdbs_folder = f'{data_top_folder}/orig/biolip_structures'
+structure_snapshots_folder = f'{data_top_folder}/cache_data/structure_snapshots'
+pdbs_index_file = f'{data_top_folder}/cache_data/pdb_files_index.json'
+feature_store_folder = f'{data_top_folder}/cache_data/feature_store'
+# node local (shared memory filesystem)
+shared_datasets_folder = '/dev/shm/protein_binding_sites/shared_datasets'
 
 # not essential
 model_comparisons_folder = f'{data_top_folder}/netw_results/comparisons'
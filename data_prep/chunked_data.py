@@ -0,0 +1,41 @@
+from typing import Callable, Iterable, Iterator, Tuple
+import numpy as np
+from numpy import ndarray
+import torch
+
+# training data that do not have to be in memory at once, estimators (see `TrainerBase.fit`)
+# go through them chunk by chunk and move only single batches to the device
+
+class ChunkedData:
+    # `chunks_factory` returns a new iterator of `(X_chunk, y_chunk)` on every call,
+    # the data are iterated multiple times (statistics, every epoch, threshold optimization)
+    def __init__(self, chunks_factory: Callable[[], Iterable[Tuple[ndarray, ndarray]]]):
+        self.chunks_factory = chunks_factory
+
+    def chunks(self, shuffle=False) -> Iterator[Tuple[ndarray, ndarray]]:
+        # order of chunks of a generic source cannot be shuffled
+        for X_chunk, y_chunk in self.chunks_factory():
+            yield np.asarray(X_chunk), np.asarray(y_chunk)
+
+    def labels(self) -> ndarray:
+        return np.concatenate([y_chunk for _, y_chunk in self.chunks()])
+
+class ArrayChunks(ChunkedData):
+    # e.g. memory mapped matrices from `FeatureStore` - only one chunk is read into memory at a time
+    def __init__(self, X, y, rows_per_chunk=65536):
+        self.X = X
+        self.y = y
+        self.rows_per_chunk = rows_per_chunk
+
+    def chunks(self, shuffle=False) -> Iterator[Tuple[ndarray, ndarray]]:
+        starts = list(range(0, len(self.X), self.rows_per_chunk))
+
+        if shuffle:
+            starts = [starts[i] for i in torch.randperm(len(starts)).tolist()]
+
+        for start in starts:
+            end = start + self.rows_per_chunk
+            yield np.asarray(self.X[start:end]), np.asarray(self.y[start:end])
+
+    def labels(self) -> ndarray:
+        return np.asarray(self.y)
@@ -2,11 +2,14 @@ import json
 import os
 import sys
 
+from data_prep.embeddings_loader import EmbeddingsLoader
+from data_prep.feature_store import FeatureStore
 from data_prep.file_cache import use_cache
 from data_prep.pdb_files_db import Chain3dStructure, PdbFilesDb
+from data_prep.shared_datasets import SharedDatasets
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
 import config.config as config
-from typing import Any, Callable, Dict, List, Union
+from typing import Any, Callable, Dict, List, Tuple, Union
 import numpy as np
 from numpy import ndarray
 from Levenshtein import distance as lev_distance
@@ -19,7 +22,8 @@ class ChainRecord:
 class ChainRecord:
     def __init__(self, csv_line: str, 
                  embedding_folder = None,
-                 pdb_db: PdbFilesDb = None):
+                 pdb_db: PdbFilesDb = None,
+                 embeddings_loader: EmbeddingsLoader = None):
         
         cols = ['id', 'chain', 'binding_sight_ID', 'ligand', 'binding_sights', 'sequence'] 
 
@@ -31,8 +35,9 @@ class ChainRecord:
         for i in range(len(cols)):
             self.__data[cols[i]] = line_parts[i]
 
-        self.__embedding_folder = embedding_folder
+        self.__embeddings_loader = embeddings_loader or EmbeddingsLoader(embedding_folder)
         self.__embeddings_data = None
+        self.__embeddings_embedder = None
 
         self.__pdb_db = pdb_db
         self.__chain_structure = None
@@ -77,22 +82,23 @@ class ChainRecord:
         return self.__data['ligand']
 
     def embeddings(self, embedder) -> Union[ndarray[ndarray[float]], None]:
-        if self.__embedding_folder is None:
-            return None
-        
-        if self.__embeddings_data is None:        
-            emb_file = os.path.join(
-                self.__embedding_folder, 
-                embedder.upper(), 
-                f'{self.full_id()}.npy')
+        self.__embeddings_embedder = embedder
 
-            self.__embeddings_data = np.load(emb_file)
+        # with a byte budget the loader decides how long the embeddings stay in memory
+        if self.__embeddings_loader.uses_shared_budget():
+            return self.__embeddings_loader.load(embedder, self.full_id())
+
+        if self.__embeddings_data is None:        
+            self.__embeddings_data = self.__embeddings_loader.load(embedder, self.full_id())
 
         return self.__embeddings_data
     
     def free_embeddings_from_RAM(self):
         self.__embeddings_data = None
 
+        if self.__embeddings_embedder is not None:
+            self.__embeddings_loader.free(self.__embeddings_embedder, self.full_id())
+
     def full_id(self) -> str:
         return f'{self.protein_id()}{self.chain_id()}'
 
@@ -159,7 +165,8 @@ class ProteinRecord:
 
 class LigandDataset:
     def __init__(self, ligand, 
-                 sequences_folder, embedding_folder, pdb_db):
+                 sequences_folder, embedding_folder, pdb_db,
+                 embeddings_loader: EmbeddingsLoader = None):
         self.ligand = ligand.upper()
         
         self.__training_data = []
@@ -169,6 +176,7 @@ class LigandDataset:
         self.__testing_data_per_binding_sight = []
         
         self.__embedding_folder = embedding_folder
+        self.__embeddings_loader = embeddings_loader or EmbeddingsLoader(embedding_folder)
         self.__pdb_db = pdb_db
 
         self.__load_all_data(sequences_folder)
@@ -226,34 +234,90 @@ class LigandDataset:
     def __construct_chain_record(self, record_line):
         return ChainRecord(record_line,
                            embedding_folder=self.__embedding_folder,
-                           pdb_db=self.__pdb_db)
+                           pdb_db=self.__pdb_db,
+                           embeddings_loader=self.__embeddings_loader)
     
-    def get_train_test_data(self, accessors, filters=[]):
+    def get_train_test_data(self, accessors, filters=[], feature_store: FeatureStore = None, dtype=np.float32, return_offsets=False,
+                            shared_datasets: SharedDatasets = None):
+        # with `feature_store` the matrices are computed only once and later runs open them as memory maps,
+        # with `shared_datasets` they are built once per node and all jobs on the node get read-only views of the same memory,
+        # `dtype` of X can be lowered to `np.float16` (estimators upcast it per batch),
+        # `return_offsets` adds the offsets of the chains in the train and test matrices (see `concat_chain_data`)
+        data = self.__get_train_test_data(accessors, filters, feature_store, shared_datasets, dtype)
+
+        return data if return_offsets else data[:4]
+
+    def __get_train_test_data(self, accessors, filters, feature_store: FeatureStore, shared_datasets: SharedDatasets, dtype):
+        if feature_store is None and shared_datasets is None:
+            return self.__compute_train_test_data(accessors, filters, dtype)
+
+        spec = FeatureStore.spec_of(accessors, filters)
+
+        if spec is None:
+            return self.__compute_train_test_data(accessors, filters, dtype)
+
+        spec['dtype'] = np.dtype(dtype).name
+
+        # the same accessors give different matrices for other embeddings (folder, served type, packed or quantized)
+        spec['embeddings'] = { embedder: self.__embeddings_loader.source_of(embedder) 
+                               for embedder in FeatureStore.embedders_of(spec) }
+
+        # raw records of the dataset are a part of the key so that changed binding sites are not missed
+        key = FeatureStore.key_for(
+            self.ligand, spec, 
+            dataset_records=[chain.original_line() for chain in self.training_per_binding_sight() + self.testing_per_binding_sight()])
+
+        if shared_datasets is not None:
+            return shared_datasets.get(key, spec, lambda: self.__stored_train_test_data(key, spec, accessors, filters, feature_store, dtype))
+
+        return self.__stored_train_test_data(key, spec, accessors, filters, feature_store, dtype)
+
+    def __stored_train_test_data(self, key, spec, accessors, filters, feature_store: FeatureStore, dtype):
+        if feature_store is None:
+            return self.__compute_train_test_data(accessors, filters, dtype)
+
+        stored_data = feature_store.load(key)
+
+        if stored_data is not None:
+            return stored_data
+
+        data = self.__compute_train_test_data(accessors, filters, dtype)
+        feature_store.save(key, data, spec)
+
+        return data
+
+    def __compute_train_test_data(self, accessors, filters, dtype):
         test, train = self.testing(), self.training()
 
         for filter in filters:
             train = filter(train)
             test = filter(test)
 
-        X_train = Helpers.concat_chain_data(
+        X_train, train_offsets = Helpers.concat_chain_data(
             *accessors,
-            chains=train
+            chains=train,
+            dtype=dtype,
+            return_offsets=True
         )
         y_train = Helpers.concat_chain_data(
             DataAccessors.biding_sights_vect(),
-            chains=train
+            chains=train,
+            dtype=np.int64
         )
 
-        X_test = Helpers.concat_chain_data(
+        X_test, test_offsets = Helpers.concat_chain_data(
             *accessors,
-            chains=test
+            chains=test,
+            dtype=dtype,
+            return_offsets=True
         )
         y_test = Helpers.concat_chain_data(
             DataAccessors.biding_sights_vect(),
-            chains=test
+            chains=test,
+            dtype=np.int64
         )
 
-        return X_train, y_train, X_test, y_test
+        return X_train, y_train, X_test, y_test, train_offsets, test_offsets
 
 class SeqDatasetDb:
     @staticmethod
@@ -262,10 +326,18 @@ class SeqDatasetDb:
     
     def __init__(self, 
                  sequences_folder=config.yu_sequences_folder,
-                 embeddings_folder=config.embeddings_folder):
+                 embeddings_folder=config.embeddings_folder,
+                 embeddings_mmap=False,
+                 embeddings_max_bytes=None,
+                 embeddings_dtype=None):
+        # `embeddings_mmap` opens embeddings as memory maps, `embeddings_max_bytes` limits 
+        # the memory taken by embeddings of all chains (least recently used are freed first)
+        # and `embeddings_dtype` (e.g. `np.float16`) sets the type of served embeddings
          
         self.__sequences_folder = sequences_folder
         self.__embedding_folder = embeddings_folder
+        self.__embeddings_loader = EmbeddingsLoader(
+            embeddings_folder, mmap=embeddings_mmap, max_bytes=embeddings_max_bytes, dtype=embeddings_dtype)
         self.__pdb_db = None
 
     def get_dataset_for(self, ligand) -> LigandDataset:
@@ -321,7 +393,8 @@ class SeqDatasetDb:
         return LigandDataset(ligand,
                              sequences_folder=self.__sequences_folder,
                              embedding_folder=self.__embedding_folder,
-                             pdb_db=self.__pdb_db)
+                             pdb_db=self.__pdb_db,
+                             embeddings_loader=self.__embeddings_loader)
 
 class Helpers: 
     @staticmethod
@@ -343,20 +416,80 @@ class Helpers:
         return valid
 
     @staticmethod
-    def concat_chain_data(*accessors, chains) -> ndarray:
-        results = []
+    def nearest_residue_matrix(chain: ChainRecord, cached_chain_structure: Chain3dStructure) -> ndarray:
+        # (residues x neighbors) matrix of indexes of the nearest residues, `cached_chain_structure` is
+        # `use_cache(chain.get_chain_structure())` - caches filled before the matrix was cached (e.g. the migrated
+        # JSON caches) hold only the rows of single residues which are stacked instead, the structure is loaded
+        # (and the matrix cached) only if neither is in cache
+        if cached_chain_structure.is_cached('get_nearest_residue_matrix'):
+            return np.asarray(cached_chain_structure.get_nearest_residue_matrix())
 
-        for chain in chains:
-            chain_vectors = accessors[0](chain)
+        if cached_chain_structure.is_cached('get_residue_count'):
+            residue_count = cached_chain_structure.get_residue_count()
 
-            for accessor in accessors[1:]:
-                part_vector = np.array(accessor(chain))
-                chain_vectors = np.column_stack((chain_vectors, part_vector))
+            if residue_count > 0 and all(cached_chain_structure.is_cached('get_nearest_residue_indexes', i) for i in range(residue_count)):
+                return np.array([
+                    cached_chain_structure.get_nearest_residue_indexes(i) for i in range(residue_count)
+                ], dtype=np.int64)
 
-            for vect in chain_vectors:
-                results.append(vect)
-            
-        return np.array(results)
+        chain_structure = chain.get_chain_structure(loaded=True)
+        matrix = np.asarray(cached_chain_structure.get_nearest_residue_matrix())
+
+        # the matrix is cached when the caller leaves `use_cache`, the structure is not needed anymore
+        chain_structure.free_memory()
+        print(f'Nearest residues of {chain.full_id()} were missing in cache, computed them during data preparation '
+              '(see pdb_files_refresh_cache.py)', flush=True)
+
+        return matrix
+
+    @staticmethod
+    def concat_chain_data(*accessors, chains, dtype=np.float32, return_offsets=False) -> Union[ndarray, Tuple[ndarray, ndarray]]:
+        # the result is allocated at once and the block of every accessor is written directly into its columns,
+        # data of a single one dimensional accessor (like binding sights) are returned as a vector,
+        # with `return_offsets` also the offsets of the chains are returned - rows of the i-th chain are `offsets[i]:offsets[i + 1]`
+        chains = list(chains)
+
+        if len(chains) == 0:
+            results = np.zeros((0,), dtype=dtype)
+            return (results, np.zeros((1,), dtype=np.int64)) if return_offsets else results
+
+        first_chain_blocks = [np.asarray(accessor(chains[0])) for accessor in accessors]
+        widths = [1 if block.ndim == 1 else block.shape[1] for block in first_chain_blocks]
+
+        rows_per_chain = [
+            len(chain.sequence()) if isinstance(chain, ChainRecord) else len(accessors[0](chain))
+            for chain in chains]
+
+        if len(accessors) == 1 and first_chain_blocks[0].ndim == 1:
+            results = np.empty((sum(rows_per_chain),), dtype=dtype)
+        else:
+            results = np.empty((sum(rows_per_chain), sum(widths)), dtype=dtype)
+
+        row = 0
+
+        for i, chain in enumerate(chains):
+            chain_rows = rows_per_chain[i]
+            column = 0
+
+            for j, accessor in enumerate(accessors):
+                block = first_chain_blocks[j] if i == 0 else np.asarray(accessor(chain))
+
+                if len(block) != chain_rows:
+                    raise ValueError(f'Accessor returned {len(block)} rows for a chain with {chain_rows} residues')
+
+                if results.ndim == 1:
+                    results[row:row + chain_rows] = block
+                else:
+                    results[row:row + chain_rows, column:column + widths[j]] = block.reshape(chain_rows, widths[j])
+
+                column += widths[j]
+
+            row += chain_rows
+
+        if return_offsets:
+            return results, np.concatenate(([0], np.cumsum(rows_per_chain))).astype(np.int64)
+
+        return results
         
 class DataAccessors:
     @staticmethod
@@ -365,6 +498,7 @@ class DataAccessors:
         def get_biding_sights_vect(chain: ChainRecord):
             return chain.binding_sights()
         
+        get_biding_sights_vect.accessor_spec = ['biding_sights_vect']
         return get_biding_sights_vect
     
     @staticmethod
@@ -373,6 +507,7 @@ class DataAccessors:
         def get_embeddings(chain: ChainRecord):
             return chain.embeddings(embedder)
 
+        get_embeddings.accessor_spec = ['embeddings', embedder.upper()]
         return get_embeddings
 
     @staticmethod
@@ -386,6 +521,8 @@ class DataAccessors:
                 result = np.column_stack((result, protrusion))
 
             return result
+        
+        get_protrusion.accessor_spec = ['protrusion', [None if radius is None else float(radius) for radius in radii]]
         return get_protrusion
     
     @staticmethod
@@ -393,6 +530,7 @@ class DataAccessors:
         def get_SASA_vector(chain: ChainRecord):
             return np.array(chain.get_SASA_vector())
 
+        get_SASA_vector.accessor_spec = ['SASA_vector']
         return get_SASA_vector
 
     @staticmethod
@@ -406,25 +544,25 @@ class DataAccessors:
         def get_neighborhood_embeddings(chain: ChainRecord):
             chain_structure = chain.get_chain_structure(loaded=False)
             
-            # if cache is full this is not needed
-            # chain_structure.load(preferred_sequence=chain.sequence())
+            # the structure is loaded only if the nearest residues are not in cache (see `Helpers.nearest_residue_matrix`)
 
             embeddings = chain.embeddings(embedder)
             
             if transform_embeddings_func is not None: 
                 embeddings = transform_embeddings_func(embeddings)
 
-            extended_embeddings = []  
+            embeddings = np.asarray(embeddings)
 
             with use_cache(chain_structure) as cached_chain_structure:
-                for i in range(cached_chain_structure.get_residue_count()):
-                    neighbors = cached_chain_structure.get_nearest_residue_indexes(i)[:neighbors_count]
+                neighbors = Helpers.nearest_residue_matrix(chain, cached_chain_structure)[:, :neighbors_count]
 
-                    extended_embeddings.append(
-                        np.array([embeddings[index] for index in neighbors]).flatten()
-                    )
+            # embeddings of all neighbors of all residues gathered at once, row `i` contains
+            # concatenated embeddings of the neighbors of residue `i`
+            return embeddings[neighbors].reshape(len(neighbors), -1)
 
-            return np.array(extended_embeddings)
+        # data transformed by an arbitrary function cannot be identified
+        if transform_embeddings_func is None:
+            get_neighborhood_embeddings.accessor_spec = ['neighborhood_embeddings', embedder.upper(), neighbors_count]
 
         return get_neighborhood_embeddings
     
@@ -434,28 +572,15 @@ class DataAccessors:
         def get_neighborhood_embeddings(chain: ChainRecord):
             chain_structure = chain.get_chain_structure(loaded=False)
             
-            # if cache is full this is not needed
-            # chain_structure.load(preferred_sequence=chain.sequence())
-
-            embeddings = chain.embeddings(embedder)
-            extended_embeddings = []  
+            # the structure is loaded only if the nearest residues are not in cache (see `Helpers.nearest_residue_matrix`)
 
+            embeddings = np.asarray(chain.embeddings(embedder))
             with use_cache(chain_structure) as cached_chain_structure:
-                for i in range(cached_chain_structure.get_residue_count()):
-                    neighbors = cached_chain_structure.get_nearest_residue_indexes(i)[:neighbors_count]
-
-                    sum_embeddings = embeddings[neighbors[0]]
-
-                    for neighbor_index in neighbors[1:]:
-                        sum_embeddings = sum_embeddings + embeddings[neighbor_index]
-
-                    sum_embeddings = sum_embeddings / neighbors_count
-
-
-                    extended_embeddings.append(
-                        sum_embeddings
-                    )
+                neighbors = Helpers.nearest_residue_matrix(chain, cached_chain_structure)[:, :neighbors_count]
 
-            return np.array(extended_embeddings)
+            # divided by `neighbors_count` even if the chain has fewer residues (as it always was)
+            # summed in float32 even for half precision embeddings
+            return embeddings[neighbors].sum(axis=1, dtype=np.float32) / neighbors_count
 
+        get_neighborhood_embeddings.accessor_spec = ['average_neighborhood_embeddings', embedder.upper(), neighbors_count]
         return get_neighborhood_embeddings
\ No newline at end of file
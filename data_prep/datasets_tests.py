@@ -9,6 +9,10 @@ import config.config as config
 import numpy as np
 import datasets_db
 import pdb_files_db
+from data_prep.feature_spec import FeatureSpec
+from data_prep.embeddings_loader import EmbeddingsLoader
+from data_prep.feature_store import FeatureStore
+from data_prep.file_cache import use_cache
 import traceback
 
 # constant parameters
@@ -220,6 +224,100 @@ def data_accessor_for_protrusion_works():
 
     return True, None
 
+def protrusion_accessor_with_unset_radius_can_be_created():
+    # scripts create the accessors of all their variants up front (e.g. `protrusion(args.second_radius)`)
+    accessor = datasets_db.DataAccessors.protrusion(8.5, None)
+
+    if accessor.accessor_spec != ['protrusion', [8.5, None]]:
+        return False, f'Unexpected accessor spec {accessor.accessor_spec}'
+
+    if FeatureStore.spec_of([accessor], []) is None:
+        return False, 'The accessor cannot be stored'
+
+    return True, None
+
+def nearest_residue_matrix_matches_nearest_residue_indexes():
+    all_chains = datasets_db.Helpers.filter_chains_with_valid_3D_file(db.get_all_chain_records())
+
+    for chain in all_chains[:20]:
+        # the rows missing in cache are computed
+        with use_cache(chain.get_chain_structure(loaded=True)) as chain_structure:
+            matrix = datasets_db.Helpers.nearest_residue_matrix(chain, chain_structure)
+
+            for i in range(chain_structure.get_residue_count()):
+                if list(matrix[i]) != list(chain_structure.get_nearest_residue_indexes(i)):
+                    return False, f'Nearest residues of {chain.full_id()} differ at residue {i}'
+
+    return True, None
+
+def feature_spec_matches_data_accessors():
+    all_chains = datasets_db.Helpers.filter_chains_with_valid_3D_file(db.get_all_chain_records())[:20]
+    accessors = datasets_db.DataAccessors
+
+    cases = [
+        (FeatureSpec(tested_embedder), [accessors.embeddings(tested_embedder)]),
+        (FeatureSpec(tested_embedder, protrusion_radii=[8.5, 3.0, 8.5], SASA=True),
+         [accessors.embeddings(tested_embedder), accessors.protrusion(8.5, 3.0, 8.5), accessors.SASA_vector()]),
+        (FeatureSpec(tested_embedder, aggregation='concat', neighbors_count=3), [accessors.neighborhood_embeddings(tested_embedder, 3)]),
+        (FeatureSpec(tested_embedder, aggregation='average', neighbors_count=5), [accessors.average_neighborhood_embeddings(tested_embedder, 5)]),
+    ]
+
+    for spec, spec_accessors in cases:
+        expected = datasets_db.Helpers.concat_chain_data(*spec_accessors, chains=all_chains)
+        actual = datasets_db.Helpers.concat_chain_data(spec.compile(), chains=all_chains)
+
+        if expected.shape != actual.shape or not (expected == actual).all():
+            return False, f'Columns of {spec} differ from its data accessors'
+
+        # both share the stored matrices
+        if FeatureStore.spec_of([spec.compile()], []) != FeatureStore.spec_of(spec_accessors, []):
+            return False, f'Feature store spec of {spec} differs from its data accessors'
+
+    return True, None
+
+def feature_store_key_depends_on_served_embeddings():
+    spec = FeatureStore.spec_of([FeatureSpec(tested_embedder, protrusion_radii=[8.5]).compile()], [])
+
+    if FeatureStore.embedders_of(spec) != [tested_embedder]:
+        return False, f'Unexpected embedders {FeatureStore.embedders_of(spec)} of {spec}'
+
+    keys = set()
+
+    for loader in [EmbeddingsLoader(path_to_embeddings_folder), 
+                   EmbeddingsLoader(path_to_embeddings_folder, dtype=np.float16),
+                   EmbeddingsLoader(os.path.join(path_to_embeddings_folder, 'other'))]:
+        spec['embeddings'] = { tested_embedder: loader.source_of(tested_embedder) }
+        keys.add(FeatureStore.key_for('ZN', spec, dataset_records=[]))
+
+    if len(keys) != 3:
+        return False, 'Matrices of differently served embeddings share a key'
+
+    return True, None
+
+def feature_spec_hash_does_not_depend_on_construction():
+    first = FeatureSpec('esm', protrusion_radii=[8.5, 3], SASA=True)
+    second = FeatureSpec(SASA=True, protrusion_radii=(8.5, 3.0), embedder='ESM')
+
+    if first != second or first.hash() != second.hash():
+        return False, f'Specs {first} and {second} differ'
+
+    # the hash identifies stored results across runs
+    if first.hash() != '3421d9d39680e7ad7b2e432c7e56c398d14fa1b9':
+        return False, f'Hash of {first} changed'
+
+    # columns are in the order of the radii
+    if first == FeatureSpec('ESM', protrusion_radii=[3.0, 8.5], SASA=True):
+        return False, 'Specs with different order of the radii are equal'
+
+    for invalid_spec in [dict(aggregation='average', neighbors_count=3), dict(embedder='ESM', aggregation='concat'), dict()]:
+        try:
+            FeatureSpec(**invalid_spec)
+            return False, f'Invalid spec {invalid_spec} was accepted'
+        except ValueError:
+            pass
+
+    return True, None
+
 def concat_chain_data_works():
     the_chain_1 = 1 
     the_chain_2 = 10 
@@ -254,6 +352,24 @@ def concat_chain_data_works():
 
     return True, None    
 
+def concat_chain_data_returns_chain_offsets():
+    def mock_accessor(chain):
+        return np.arange(chain)
+
+    actual, offsets = datasets_db.Helpers.concat_chain_data(
+        mock_accessor,
+        chains=[3, 1, 2],
+        return_offsets=True
+    )
+
+    if not (offsets == np.array([0, 3, 4, 6])).all():
+        return False, f'Unexpected offsets {offsets}'
+
+    if not (actual[offsets[2]:offsets[3]] == np.arange(2)).all():
+        return False, f'Rows of the last chain are not at its offsets'
+
+    return True, None
+
 def can_load_all_embeddings():
     all_chains = db.get_all_chain_records()
 
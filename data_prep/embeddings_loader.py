@@ -0,0 +1,92 @@
+import os
+from typing import Dict, Union
+import numpy as np
+from numpy import ndarray
+from data_prep.file_cache import SizedLRU
+from data_prep.packed_embeddings import PackedEmbeddings
+
+class EmbeddingsLoader:
+    # `mmap`:      embeddings are opened as read-only memory maps instead of being read into RAM
+    # `max_bytes`: embeddings are kept in the LRU `self.cache` of the loader limited to `max_bytes` (across all
+    #              chains using the loader, e.g. of one `SeqDatasetDb`) instead of being kept by each chain record
+    #              until it is freed - every loader has its own budget
+    # `dtype`:     embeddings are served in this type (e.g. `np.float16` to halve the memory)
+    def __init__(self, embeddings_folder, mmap=False, max_bytes=None, dtype=None):
+        self.embeddings_folder = embeddings_folder
+        self.mmap = mmap
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+
+        # packed embeddings (see `pack_embeddings.py`) are preferred over the files of single chains
+        self.packed: Dict[str, Union[PackedEmbeddings, None]] = {}
+
+        self.cache = SizedLRU(max_bytes=max_bytes) if max_bytes is not None else None
+
+    def uses_shared_budget(self) -> bool:
+        return self.max_bytes is not None
+
+    def load(self, embedder, full_id) -> Union[ndarray, None]:
+        if self.embeddings_folder is None:
+            return None
+
+        if not self.uses_shared_budget():
+            return self.__read(embedder, full_id)
+
+        key = self.__key(embedder, full_id)
+        embeddings = self.cache.get(key)
+
+        if embeddings is None:
+            embeddings = self.__read(embedder, full_id)
+            self.cache.put(key, embeddings, embeddings.nbytes)
+
+        return embeddings
+
+    def source_of(self, embedder) -> dict:
+        # describes what `load` serves for the embedder (e.g. to be a part of the key of stored feature matrices),
+        # `mmap` and `max_bytes` do not change the values
+        embedder = embedder.upper()
+        packed = PackedEmbeddings.exists(self.embeddings_folder, embedder) if self.embeddings_folder is not None else False
+
+        return {
+            'folder': os.path.abspath(self.embeddings_folder) if self.embeddings_folder is not None else None,
+            'dtype': np.dtype(self.dtype).name if self.dtype is not None else None,
+            'packed': PackedEmbeddings.stamp_of(self.embeddings_folder, embedder) if packed else None,
+        }
+
+    def free(self, embedder, full_id):
+        if self.uses_shared_budget():
+            self.cache.remove(self.__key(embedder, full_id))
+
+    def __read(self, embedder, full_id) -> ndarray:
+        embeddings = self.__read_stored(embedder, full_id)
+
+        if self.dtype is not None:
+            embeddings = embeddings.astype(self.dtype, copy=False)
+
+        return embeddings
+
+    def __read_stored(self, embedder, full_id) -> ndarray:
+        packed = self.__packed_for(embedder)
+        embeddings = packed.get(full_id) if packed is not None else None
+
+        if embeddings is not None:
+            return embeddings if self.mmap else np.array(embeddings)
+
+        emb_file = os.path.join(
+            self.embeddings_folder,
+            embedder.upper(),
+            f'{full_id}.npy')
+
+        return np.load(emb_file, mmap_mode='r' if self.mmap else None)
+
+    def __packed_for(self, embedder) -> Union[PackedEmbeddings, None]:
+        embedder = embedder.upper()
+
+        if embedder not in self.packed:
+            self.packed[embedder] = PackedEmbeddings(self.embeddings_folder, embedder) \
+                                    if PackedEmbeddings.exists(self.embeddings_folder, embedder) else None
+
+        return self.packed[embedder]
+
+    def __key(self, embedder, full_id):
+        return (embedder.upper(), full_id)
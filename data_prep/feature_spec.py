@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import sys
+from typing import Callable, Dict, List, Union
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from data_prep.datasets_db import ChainRecord, DataAccessors, Helpers
+from data_prep.file_cache import use_cache
+import numpy as np
+from numpy import ndarray
+
+# increase when the meaning of a spec changes so that its hash changes as well (the feature store keys
+# do not depend on it - the compiled columns always equal the columns of the equivalent `DataAccessors`)
+feature_spec_version = 1
+
+aggregations = [None, 'concat', 'average']
+
+# functions transforming embeddings identified by their id, the id has to change when the function changes
+embedding_transforms: Dict[str, Callable[[ndarray], ndarray]] = {}
+
+class FeatureSpec:
+    # declarative description of a feature vector of a residue compiled into one accessor for `get_train_test_data`,
+    # the columns are (in this order):
+    #   - embeddings of the residue (`aggregation=None`), concatenated (`'concat'`) or averaged (`'average'`)
+    #     embeddings of its `neighbors_count` nearest residues, optionally transformed by `transform_id`
+    #   - protrusion for every radius of `protrusion_radii`
+    #   - SASA value of the residue
+    # equal specs have equal hashes no matter how they were created, the feature store keys are the same as
+    # the keys of the equivalent `DataAccessors` lists (see `accessor_specs`) so that they share the stored matrices
+    def __init__(self, embedder=None, aggregation=None, neighbors_count=0,
+                 protrusion_radii: List[float] = [], SASA=False, transform_id=None):
+
+        if aggregation not in aggregations:
+            raise ValueError(f'Unknown aggregation {aggregation}, expected one of {aggregations}')
+
+        if aggregation is not None and embedder is None:
+            raise ValueError(f'Aggregation {aggregation} needs an embedder')
+
+        if aggregation is not None and neighbors_count < 1:
+            raise ValueError(f'Aggregation {aggregation} needs at least one neighbor')
+
+        if any(radius is None for radius in protrusion_radii):
+            raise ValueError(f'Protrusion radius is not set in {protrusion_radii}')
+
+        if embedder is None and len(protrusion_radii) == 0 and not SASA:
+            raise ValueError('Feature spec has no columns')
+
+        self.embedder = embedder.upper() if embedder is not None else None
+        self.aggregation = aggregation
+        self.neighbors_count = neighbors_count if aggregation is not None else 0
+        self.protrusion_radii = list(protrusion_radii)
+        self.SASA = SASA
+        self.transform_id = transform_id
+
+    @staticmethod
+    def register_transform(transform_id, transform: Callable[[ndarray], ndarray]):
+        embedding_transforms[transform_id] = transform
+
+    def to_dict(self) -> dict:
+        return {
+            'embedder': self.embedder,
+            'aggregation': self.aggregation,
+            'neighbors_count': self.neighbors_count,
+            'protrusion_radii': [float(radius) for radius in self.protrusion_radii],
+            'SASA': self.SASA,
+            'transform_id': self.transform_id,
+        }
+
+    def hash(self) -> str:
+        content = { 'version': feature_spec_version, 'spec': self.to_dict() }
+        return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def accessor_specs(self) -> list:
+        # specs of the `DataAccessors` computing the same columns - for the embeddings, all protrusion radii
+        # by one `DataAccessors.protrusion` and SASA
+        specs = []
+
+        if self.embedder is not None and self.transform_id is not None:
+            # `DataAccessors` cannot identify transformed embeddings
+            specs.append(['transformed_embeddings', self.embedder, self.transform_id, self.aggregation, self.neighbors_count])
+        elif self.aggregation == 'concat':
+            specs.append(DataAccessors.neighborhood_embeddings(self.embedder, self.neighbors_count).accessor_spec)
+        elif self.aggregation == 'average':
+            specs.append(DataAccessors.average_neighborhood_embeddings(self.embedder, self.neighbors_count).accessor_spec)
+        elif self.embedder is not None:
+            specs.append(DataAccessors.embeddings(self.embedder).accessor_spec)
+
+        if len(self.protrusion_radii) > 0:
+            specs.append(DataAccessors.protrusion(*self.protrusion_radii).accessor_spec)
+
+        if self.SASA:
+            specs.append(DataAccessors.SASA_vector().accessor_spec)
+
+        return specs
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureSpec) and self.hash() == other.hash()
+
+    def __hash__(self):
+        return hash(self.hash())
+
+    def __repr__(self):
+        return f'FeatureSpec({self.to_dict()})'
+
+    def compile(self) -> Callable[[ChainRecord], ndarray]:
+        # every source is read once per chain: the embeddings, the structure cache (nearest residues,
+        # protrusion of every distinct radius and SASA) - radii repeated in the spec are computed only once
+        transform = embedding_transforms[self.transform_id] if self.transform_id is not None else None
+        distinct_radii = list(dict.fromkeys(self.protrusion_radii))
+        radius_columns = [distinct_radii.index(radius) for radius in self.protrusion_radii]
+
+        needs_structure = self.aggregation is not None or len(distinct_radii) > 0 or self.SASA
+
+        def get_features(chain: ChainRecord):
+            nearest_residues, protrusion, SASA = None, None, None
+
+            if needs_structure:
+                with use_cache(chain.get_chain_structure()) as chain_structure:
+                    if self.aggregation is not None:
+                        nearest_residues = Helpers.nearest_residue_matrix(chain, chain_structure)[:, :self.neighbors_count]
+
+                    if len(distinct_radii) > 0:
+                        protrusion = np.column_stack([
+                            chain_structure.get_protrusion_vector(radius=radius) for radius in distinct_radii])
+
+                    if self.SASA:
+                        SASA = np.asarray(chain_structure.get_SASA_vector())
+
+            blocks = []
+
+            if self.embedder is not None:
+                blocks.append(self.__embeddings_block(chain, transform, nearest_residues))
+
+            if protrusion is not None:
+                blocks.append(protrusion[:, radius_columns])
+
+            if SASA is not None:
+                blocks.append(SASA.reshape(-1, 1))
+
+            # one matrix per chain, `concat_chain_data` then copies it at once (and casts it to the requested type)
+            result = np.empty((len(blocks[0]), sum(block.shape[1] for block in blocks)),
+                              dtype=np.result_type(*[block.dtype for block in blocks]))
+            column = 0
+
+            for block in blocks:
+                result[:, column:column + block.shape[1]] = block
+                column += block.shape[1]
+
+            return result
+
+        # `FeatureStore.spec_of` uses the specs of the replaced accessors
+        get_features.accessor_specs = self.accessor_specs()
+        return get_features
+
+    def __embeddings_block(self, chain: ChainRecord, transform, nearest_residues: Union[ndarray, None]) -> ndarray:
+        embeddings = chain.embeddings(self.embedder)
+
+        if transform is not None:
+            embeddings = transform(embeddings)
+
+        embeddings = np.asarray(embeddings)
+
+        if self.aggregation == 'concat':
+            return embeddings[nearest_residues].reshape(len(nearest_residues), -1)
+
+        if self.aggregation == 'average':
+            # the same values as `DataAccessors.average_neighborhood_embeddings`
+            return embeddings[nearest_residues].sum(axis=1, dtype=np.float32) / self.neighbors_count
+
+        return embeddings
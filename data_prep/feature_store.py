@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+from typing import Callable, List, Tuple, Union
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config.config as config
+import numpy as np
+from numpy import ndarray
+
+# increase when the way the feature vectors are computed changes (e.g. a fix in an accessor)
+# so that no outdated matrices are used
+feature_store_version = 4
+
+data_parts = ['X_train', 'y_train', 'X_test', 'y_test', 'train_offsets', 'test_offsets']
+
+class FeatureStore:
+    # materialized results of `LigandDataset.get_train_test_data`, one folder per
+    # ligand + accessors + filters with one `.npy` file per matrix that is opened as a memory map
+    def __init__(self, folder=config.feature_store_folder):
+        self.folder = folder
+
+    @staticmethod
+    def spec_of(accessors: List[Callable], filters: List[Callable]) -> Union[dict, None]:
+        # accessors created by `DataAccessors` describe themselves by `accessor_spec`, a compiled `FeatureSpec` by
+        # `accessor_specs` of the accessors it replaces, data of custom accessors or filters (e.g. lambdas)
+        # cannot be identified and are not stored
+        accessor_specs = []
+
+        for accessor in accessors:
+            accessor_specs.extend(getattr(accessor, 'accessor_specs', [getattr(accessor, 'accessor_spec', None)]))
+
+        if any(spec is None for spec in accessor_specs):
+            return None
+
+        filter_names = [filter.__qualname__ for filter in filters]
+
+        if any('<lambda>' in name or '<locals>' in name for name in filter_names):
+            return None
+
+        return {
+            'accessors': accessor_specs,
+            'filters': filter_names,
+        }
+
+    @staticmethod
+    def embedders_of(spec: dict) -> List[str]:
+        # accessors of embeddings have the embedder right after their name (see `DataAccessors`, `FeatureSpec`)
+        return sorted({ accessor_spec[1] for accessor_spec in spec['accessors'] if 'embeddings' in accessor_spec[0] })
+
+    @staticmethod
+    def key_for(ligand, spec: dict, dataset_records: List[str]) -> str:
+        content = {
+            'version': feature_store_version,
+            'ligand': ligand,
+            'spec': spec,
+
+            # the dataset itself may change
+            'dataset_records': dataset_records,
+        }
+
+        content_hash = hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+        return f'{ligand}.{content_hash}'
+
+    def load(self, key) -> Union[Tuple[ndarray, ...], None]:
+        data_folder = os.path.join(self.folder, key)
+
+        if not os.path.isdir(data_folder):
+            return None
+
+        return tuple(np.load(os.path.join(data_folder, f'{part}.npy'), mmap_mode='r', allow_pickle=False)
+                     for part in data_parts)
+
+    def save(self, key, data: Tuple[ndarray, ...], spec: dict):
+        data_folder = os.path.join(self.folder, key)
+        tmp_folder = f'{data_folder}.{os.getpid()}.tmp'
+
+        os.makedirs(tmp_folder, exist_ok=True)
+
+        for part, matrix in zip(data_parts, data):
+            np.save(os.path.join(tmp_folder, f'{part}.npy'), np.asarray(matrix), allow_pickle=False)
+
+        # only for humans browsing the store
+        with open(os.path.join(tmp_folder, 'spec.json'), 'w') as f:
+            json.dump({ 'key': key, 'version': feature_store_version, 'spec': spec }, f, indent=4)
+
+        try:
+            # renaming of the whole folder is atomic, readers never see half written data
+            os.rename(tmp_folder, data_folder)
+        except OSError:
+            # other job stored the same data in the meantime
+            shutil.rmtree(tmp_folder, ignore_errors=True)
@@ -2,13 +2,102 @@ import json
 import os
 import pprint
 import sys
+import zipfile
+from collections import OrderedDict
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
 import config.config as config
 from typing import TypeVar
+import numpy as np
+
+class JsonCacheStorage:
+    # human readable storage - every value is kept as plain python values (arrays and tuples as lists)
+    extension = 'json'
+
+    def read(self, file):
+        with open(file, 'r') as f:
+            return json.load(f)
+
+    def write(self, file, cache):
+        result = pprint.pformat(self.__to_json_compatible(cache), compact=True, width=150).replace("'",'"')
+        with open(file, 'w') as f:
+            f.write(result)
+
+        # safer but less readable dump
+        # with open(file, "w") as f:
+        #     json.dump(cache, f, indent=2)
+
+    def encode(self, value):
+        # the value is kept as it is going to be read from the file (arrays and tuples as lists)
+        return self.__to_json_compatible(value)
+
+    def decode(self, value):
+        return value
+
+    def __to_json_compatible(self, value):
+        if isinstance(value, dict):
+            return { key: self.__to_json_compatible(val) for key, val in value.items() }
+        if isinstance(value, (list, tuple)):
+            return [self.__to_json_compatible(val) for val in value]
+        if isinstance(value, (np.ndarray, np.generic)):
+            return value.tolist()
+        return value
+
+class NpzCacheStorage:
+    # binary storage - every value is kept as a typed numpy array in one `.npz` file per cache key
+    extension = 'npz'
+    key_separator = '::'
+
+    def read(self, file):
+        cache = {}
+
+        with np.load(file, allow_pickle=False) as stored:
+            for stored_key in stored.files:
+                method_name, key_to_cache = stored_key.split(self.key_separator, 1)
+
+                if method_name not in cache:
+                    cache[method_name] = {}
+
+                cache[method_name][key_to_cache] = stored[stored_key]
+
+        return cache
+
+    def write(self, file, cache):
+        arrays = {
+            f'{method_name}{self.key_separator}{key_to_cache}': value
+            for method_name, cache_record in cache.items()
+            for key_to_cache, value in cache_record.items()
+        }
+
+        # write to a temporary file first so that readers never see a half-written cache
+        tmp_file = f'{file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, **arrays)
+
+        os.replace(tmp_file, file)
+
+    def encode(self, value):
+        return np.asarray(value)
+
+    def decode(self, value):
+        # scalars (residue count, sequence, flags) are returned as plain python values
+        if value.ndim == 0:
+            return value.item()
+        return value
+
+cache_storages = {
+    JsonCacheStorage.extension: JsonCacheStorage,
+    NpzCacheStorage.extension: NpzCacheStorage,
+}
+
+default_storage_format = NpzCacheStorage.extension
 
 class FileCache:
-    def __init__(self, file_key, data_folder):
-        self.file = os.path.join(data_folder, f'{file_key}.json')
+    def __init__(self, file_key, data_folder, storage_format=None):
+        self.storage = cache_storages[storage_format or default_storage_format]()
+
+        self.file = os.path.join(data_folder, f'{file_key}.{self.storage.extension}')
+        self.legacy_file = os.path.join(data_folder, f'{file_key}.{JsonCacheStorage.extension}')
+
         self.cache = None
         self.cache_modified = False
 
@@ -16,12 +105,11 @@ class FileCache:
     
     def load(self):
         try: 
-            with open(self.file, 'r') as file:
-                self.cache = json.load(file)
+            self.cache = self.storage.read(self.file)
         except FileNotFoundError:
-            self.cache = {}
-        except json.JSONDecodeError as json_error:
-            print("\nError parsing JSON:", json_error, '\n')
+            self.cache = self.__load_legacy_cache()
+        except (json.JSONDecodeError, zipfile.BadZipFile, EOFError, ValueError, OSError) as error:
+            print("\nError parsing cache file:", self.file, error, '\n')
             self.cache = {}
 
     def get_value_for(self, method_name, *args, **kwargs):
@@ -34,34 +122,64 @@ class FileCache:
         if key_to_cache not in cache_record:
             return False, None
         
-        return True, cache_record[key_to_cache]
+        return True, self.storage.decode(cache_record[key_to_cache])
 
     def save(self, value, method_name, *args, **kwargs):
+        # returns the value as `get_value_for` returns it (e.g. lists become arrays in the npz storage)
         if method_name not in self.cache:
             self.cache[method_name] = {}
         
         cache_record = self.cache[method_name]
         key_to_cache = self.__get_key_to_cache(*args, **kwargs)
 
-        cache_record[key_to_cache] = value
+        cache_record[key_to_cache] = self.storage.encode(value)
 
         self.cache_modified = True
 
+        return self.storage.decode(cache_record[key_to_cache])
+
     def flush(self):
         if not self.cache_modified:
             return
 
-        result = pprint.pformat(self.cache, compact=True, width=150).replace("'",'"')
-        with open(self.file, 'w') as file:
-            file.write(result)
-
-        # safer but less readable dump
-        # with open(self.file, "w") as f:
-        #     json.dump(self.cache, f, indent=2)
+        self.storage.write(self.file, self.cache)
+        self.cache_modified = False
 
     def free_memory(self):
         self.cache = None
 
+    def size_in_bytes(self):
+        if self.cache is None:
+            return 0
+
+        # arrays are counted exactly, other values (json storage) only roughly
+        return sum(
+            value.nbytes if isinstance(value, np.ndarray) else sys.getsizeof(value)
+            for cache_record in self.cache.values()
+            for value in cache_record.values()
+        )
+
+    def __load_legacy_cache(self):
+        # caches created before the binary storage existed are migrated on first use
+        if self.legacy_file == self.file or not os.path.exists(self.legacy_file):
+            return {}
+
+        try:
+            legacy_cache = JsonCacheStorage().read(self.legacy_file)
+        except json.JSONDecodeError as json_error:
+            print("\nError parsing JSON:", json_error, '\n')
+            return {}
+
+        self.cache_modified = True
+
+        return {
+            method_name: { 
+                key_to_cache: self.storage.encode(value) 
+                for key_to_cache, value in cache_record.items() 
+            }
+            for method_name, cache_record in legacy_cache.items()
+        }
+
     def __get_key_to_cache(self, *args, **kwargs):
         args_str = ', '.join(repr(arg) for arg in args)
         kwargs_str = ', '.join(
@@ -69,9 +187,84 @@ class FileCache:
         )
         return f"{args_str}, {kwargs_str}".replace('"', '').replace("'", '')
                 
+class SizedLRU:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__items = OrderedDict()
+
+    def get(self, key):
+        if key not in self.__items:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__items.move_to_end(key)
+
+        value, _ = self.__items[key]
+        return value
+
+    def put(self, key, value, size_in_bytes):
+        self.remove(key)
+
+        self.__items[key] = (value, size_in_bytes)
+        self.total_bytes += size_in_bytes
+
+        # the most recent item is kept even if it exceeds the limit on its own
+        self.__evict_over_limit(keep_items=1)
+
+    def remove(self, key):
+        if key in self.__items:
+            _, size_in_bytes = self.__items.pop(key)
+            self.total_bytes -= size_in_bytes
+
+    def clear(self):
+        self.__items.clear()
+        self.total_bytes = 0
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.__evict_over_limit(keep_items=0)
+
+    def __len__(self):
+        return len(self.__items)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'items': len(self.__items),
+            'total_bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+    def __evict_over_limit(self, keep_items):
+        while self.total_bytes > self.max_bytes and len(self.__items) > keep_items:
+            _, (_, evicted_size) = self.__items.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+# decoded caches shared by all `use_cache` calls within the process
+# (so that repeated accessor calls for the same chain do not read the file again)
+shared_file_caches = SizedLRU(max_bytes=512 * 1024 * 1024)
+
 T = TypeVar('T')
-def use_cache(object: T, data_folder=config.cache_folder) -> T:
-    cache = FileCache(file_key=object.__cache_key__, data_folder=data_folder)
+def use_cache(object: T, data_folder=config.cache_folder, storage_format=None, keep_in_memory=True) -> T:
+    cache_id = (os.path.abspath(data_folder), object.__cache_key__, storage_format or default_storage_format)
+
+    cache = None
+
+    if keep_in_memory:
+        cache = shared_file_caches.get(cache_id)
+    else:
+        # the file is going to be read again, the shared copy would become stale
+        shared_file_caches.remove(cache_id)
+
+    if cache is None:
+        cache = FileCache(file_key=object.__cache_key__, data_folder=data_folder, storage_format=storage_format)
 
     class CachedCalls:
         def __enter__(self) -> T:
@@ -79,9 +272,17 @@ def use_cache(object: T, data_folder=config.cache_folder) -> T:
         
         def __exit__(self, exc_type, exc_value, traceback):
             cache.flush()
-            cache.free_memory()
+
+            if keep_in_memory:
+                shared_file_caches.put(cache_id, cache, cache.size_in_bytes())
+            else:
+                cache.free_memory()
 
         def __getattribute__(self, name):
+            if name == 'is_cached':
+                # `cached.is_cached('method_name', *args, **kwargs)` tells whether the call would be served from cache
+                return lambda method_name, *args, **kwargs: cache.get_value_for(method_name, *args, **kwargs)[0]
+
             attribute = object.__getattribute__(name)
             cashable_attributes = object.__getattribute__('__cashable__')
             
@@ -98,10 +299,9 @@ def use_cache(object: T, data_folder=config.cache_folder) -> T:
                 if is_in_cache:
                     return value
 
+                # the first call returns the same type as the calls served from cache
                 result = method(*args, **kwargs)
-                cache.save(result, name, *args, **kwargs)
-
-                return result
+                return cache.save(result, name, *args, **kwargs)
 
             return cached_call_wrapper
 
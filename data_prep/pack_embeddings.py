@@ -0,0 +1,26 @@
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config.config as config
+
+import numpy as np
+from packed_embeddings import PackedEmbeddings
+from datetime import timedelta
+
+# python3 /home/brabecm4/diplomka/protein-binding-sites/data_prep/pack_embeddings.py --embedder ESM
+
+parser = argparse.ArgumentParser(description='Pack embeddings of all chains into one memory mapped file per embedder')
+parser.add_argument('--embedder', type=str, nargs='+', required=True, help='Embedders to be packed')
+parser.add_argument('--embeddings-folder', type=str, default=config.embeddings_folder, help='Folder with embeddings')
+parser.add_argument('--dtype', type=str, choices=['float32', 'float16', 'int8'], default='float32', help='Type of the packed values (int8 is quantized per dimension)')
+args = parser.parse_args()
+
+for embedder in args.embedder:
+    start_time = time.time()
+
+    chains_count = PackedEmbeddings.pack(args.embeddings_folder, embedder, dtype=np.dtype(args.dtype))
+
+    elapsed_time_secs = time.time() - start_time
+    print(f'{embedder}: packed {chains_count} chains into {PackedEmbeddings.folder_for(args.embeddings_folder, embedder)} in {timedelta(seconds=elapsed_time_secs)}')
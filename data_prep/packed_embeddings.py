@@ -0,0 +1,136 @@
+import json
+import os
+from typing import Dict, Union
+import numpy as np
+from numpy import ndarray
+
+# all embeddings of one embedder concatenated into one `.npy` file (residues x embedding size)
+# and a JSON index mapping the chain ID to its rows, opening one file per job
+# is much cheaper than opening thousands of small files on a network filesystem
+
+packed_suffix = 'packed'
+packed_embeddings_file = 'embeddings.npy'
+packed_index_file = 'index.json'
+packed_quantization_file = 'quantization.npz'
+
+class PackedEmbeddings:
+    def __init__(self, embeddings_folder, embedder):
+        self.folder = PackedEmbeddings.folder_for(embeddings_folder, embedder)
+
+        with open(os.path.join(self.folder, packed_index_file), 'r') as f:
+            self.index: Dict[str, list] = json.load(f)['chains']
+
+        self.embeddings = np.load(os.path.join(self.folder, packed_embeddings_file), mmap_mode='r')
+
+        # int8 packages store `round((value - offset) / scale) - 128` per dimension (offset is the minimum)
+        self.quantization = None
+
+        if self.embeddings.dtype == np.int8:
+            with np.load(os.path.join(self.folder, packed_quantization_file)) as quantization:
+                self.quantization = (quantization['scale'], quantization['offset'])
+
+    @staticmethod
+    def folder_for(embeddings_folder, embedder):
+        return os.path.join(embeddings_folder, f'{embedder.upper()}.{packed_suffix}')
+
+    @staticmethod
+    def exists(embeddings_folder, embedder) -> bool:
+        return os.path.exists(os.path.join(PackedEmbeddings.folder_for(embeddings_folder, embedder), packed_index_file))
+
+    @staticmethod
+    def stamp_of(embeddings_folder, embedder) -> dict:
+        # identifies the package without reading the index - its storage type and sizes and modification
+        # times of its files (a repacked package or changed quantization gets a different stamp)
+        folder = PackedEmbeddings.folder_for(embeddings_folder, embedder)
+        files = [packed_embeddings_file, packed_index_file, packed_quantization_file]
+
+        stats = { file: os.stat(os.path.join(folder, file)) for file in files if os.path.exists(os.path.join(folder, file)) }
+
+        return {
+            'dtype': np.load(os.path.join(folder, packed_embeddings_file), mmap_mode='r').dtype.name,
+            'files': { file: [stat.st_size, stat.st_mtime_ns] for file, stat in stats.items() },
+        }
+
+    def get(self, full_id) -> Union[ndarray, None]:
+        # returns a view into the memory map (quantized embeddings are dequantized to float16)
+        if full_id not in self.index:
+            return None
+
+        offset, length = self.index[full_id]
+        rows = self.embeddings[offset:offset + length]
+
+        if self.quantization is None:
+            return rows
+
+        scale, minimum = self.quantization
+        return ((rows.astype(np.float32) + 128) * scale + minimum).astype(np.float16)
+
+    @staticmethod
+    def pack(embeddings_folder, embedder, dtype=np.float32) -> int:
+        source_folder = os.path.join(embeddings_folder, embedder.upper())
+        target_folder = PackedEmbeddings.folder_for(embeddings_folder, embedder)
+
+        files = sorted(file for file in os.listdir(source_folder) if file.endswith('.npy'))
+
+        # only headers are read to compute the size of the result
+        shapes = [np.load(os.path.join(source_folder, file), mmap_mode='r').shape for file in files]
+        total_residues = sum(shape[0] for shape in shapes)
+        embedding_size = shapes[0][1] if len(shapes) > 0 else 0
+
+        os.makedirs(target_folder, exist_ok=True)
+
+        quantized = np.dtype(dtype) == np.int8
+
+        if quantized:
+            scale, minimum = PackedEmbeddings.__quantization_for(source_folder, files, embedding_size)
+            np.savez(os.path.join(target_folder, packed_quantization_file), scale=scale, offset=minimum)
+        elif os.path.exists(os.path.join(target_folder, packed_quantization_file)):
+            os.remove(os.path.join(target_folder, packed_quantization_file))
+
+        tmp_embeddings_file = os.path.join(target_folder, f'{packed_embeddings_file}.{os.getpid()}.tmp')
+        packed = np.lib.format.open_memmap(
+            tmp_embeddings_file, mode='w+', dtype=dtype, shape=(total_residues, embedding_size))
+
+        index = {}
+        offset = 0
+
+        for file, shape in zip(files, shapes):
+            if shape[1:] != (embedding_size,):
+                raise ValueError(f'Embeddings in {file} have shape {shape}, expected (n, {embedding_size})')
+
+            embeddings = np.load(os.path.join(source_folder, file))
+
+            if quantized:
+                embeddings = np.clip(np.round((embeddings - minimum) / scale), 0, 255) - 128
+
+            packed[offset:offset + shape[0]] = embeddings
+            index[file[:-len('.npy')]] = [offset, shape[0]]
+            offset += shape[0]
+
+        packed.flush()
+        del packed
+
+        tmp_index_file = os.path.join(target_folder, f'{packed_index_file}.{os.getpid()}.tmp')
+        with open(tmp_index_file, 'w') as f:
+            json.dump({ 'dtype': np.dtype(dtype).name, 'chains': index }, f)
+
+        # jobs that already opened the old files keep reading them, 
+        # however, do not repack while new jobs are starting
+        os.replace(tmp_embeddings_file, os.path.join(target_folder, packed_embeddings_file))
+        os.replace(tmp_index_file, os.path.join(target_folder, packed_index_file))
+
+        return len(index)
+
+    @staticmethod
+    def __quantization_for(source_folder, files, embedding_size):
+        minimum = np.full(embedding_size, np.inf, dtype=np.float32)
+        maximum = np.full(embedding_size, -np.inf, dtype=np.float32)
+
+        for file in files:
+            embeddings = np.load(os.path.join(source_folder, file), mmap_mode='r')
+            minimum = np.minimum(minimum, embeddings.min(axis=0))
+            maximum = np.maximum(maximum, embeddings.max(axis=0))
+
+        # constant dimensions would be divided by zero
+        scale = np.where(maximum > minimum, (maximum - minimum) / 255, 1).astype(np.float32)
+        return scale, minimum
@@ -5,58 +5,84 @@ sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
 import config.config as config
 from Bio.PDB import PDBParser
 from Bio.PDB import MMCIFParser
+from Bio.PDB.Chain import Chain
 from Bio.PDB.Residue import Residue
 from Bio.PDB.Structure import Structure
 from Bio.PDB.NeighborSearch import NeighborSearch
+from Bio.PDB.kdtrees import KDTree
 from Levenshtein import distance as lev_distance
 from Bio.PDB.SASA import ShrakeRupley
+from data_prep.pdb_files_index import PdbFilesIndex
+from data_prep.structure_snapshots import ChainGeometry, StructureSnapshots
+from data_prep.structure_streaming import StreamingChainLoader, UnsupportedStructureFile
+import numpy as np
+from numpy import ndarray
 
 class Chain3dStructure:
     def __init__(self, 
                  protein_id, chain_id,
                  structure_filename, 
-                 load=False):
+                 load=False,
+                 snapshots: StructureSnapshots = None):
         
         self.__cache_key__ = f'{protein_id.lower()}{chain_id.upper()}'
         self.__cashable__ = [
             self.get_residue_count.__name__,
             self.get_nearest_residue_indexes.__name__,
+            self.get_nearest_residue_matrix.__name__,
             self.all_residues_has_alpha_carbon.__name__,
             self.compute_sequence.__name__,
             self.get_protrusion_vector.__name__,
+            self.get_protrusion_matrix.__name__,
             self.get_SASA_vector.__name__
         ]
 
         self.protein_id = protein_id
         self.chain_id = chain_id
         self.structure_file = structure_filename
+        self.snapshots = snapshots
         
         self._3d_structure: Union[Structure, None] = None
         self._3d_chain = None
+        self._alpha_carbon_coords = None
+        self._protrusion_memo = {}
+        self._nearest_memo = {}
 
         if load:
             self.load()
 
-    def load(self, preferred_sequence=None):
-        if (self.structure_file.endswith('cif')):
-            parser = MMCIFParser(QUIET=True)
-        else:
-            parser = PDBParser(QUIET=True)
+    def load(self, preferred_sequence=None, all_models=False, streaming=True):
+        # only the first model is considered unless `all_models` is set,
+        # `streaming=False` parses the whole file by Biopython parsers (slow and memory hungry for big entries)
+        self._alpha_carbon_coords = None
+        self._protrusion_memo = {}
+        self._nearest_memo = {}
 
-        self._3d_structure = parser.get_structure(id, self.structure_file)
+        load_options = { 'all_models': all_models, 'streaming': streaming }
 
-        found_chains = []
+        if self.__load_snapshot(preferred_sequence, load_options):
+            return
 
-        for model in self._3d_structure:
-            for chain in model.get_chains():
-                if chain.id.lower() == self.chain_id.lower():
-                    found_chains.append(chain)                    
+        found_chains = None
+
+        if streaming:
+            self._3d_structure = None
+
+            try:
+                found_chains = StreamingChainLoader(self.structure_file).load_chains(self.chain_id, all_models=all_models)
+            except UnsupportedStructureFile:
+                # e.g. mmCIF without the atom site loop - left to the full parser
+                pass
+
+        if found_chains is None:
+            found_chains = self.__parse_whole_structure(all_models)
 
         if len(found_chains) == 0:
             raise Exception(f"Chain with ID {self.chain_id} not found in the structure. Protein {self.protein_id} - file {self.structure_file}")
 
         if len(found_chains) == 1 or preferred_sequence is None:
             self._3d_chain = found_chains[0]
+            self.__save_snapshot(preferred_sequence, load_options, ambiguous=len(found_chains) > 1)
             return
         
         best_match_chain = found_chains[0]
@@ -71,6 +97,47 @@ class Chain3dStructure:
                 best_match_chain = chain
 
         self._3d_chain = best_match_chain
+        self.__save_snapshot(preferred_sequence, load_options, ambiguous=True)
+
+    def __parse_whole_structure(self, all_models) -> List[Chain]:
+        if (self.structure_file.endswith('cif')):
+            parser = MMCIFParser(QUIET=True)
+        else:
+            parser = PDBParser(QUIET=True)
+
+        self._3d_structure = parser.get_structure(id, self.structure_file)
+        models = list(self._3d_structure) if all_models else list(self._3d_structure)[:1]
+
+        found_chains = []
+
+        for model in models:
+            for chain in model.get_chains():
+                if chain.id.lower() == self.chain_id.lower():
+                    found_chains.append(chain)
+
+        return found_chains
+
+    def __load_snapshot(self, preferred_sequence, load_options) -> bool:
+        if self.snapshots is None:
+            return False
+
+        geometry = self.snapshots.load(
+            self.__cache_key__, self.chain_id, self.structure_file, load_options, preferred_sequence=preferred_sequence)
+
+        if geometry is None:
+            return False
+
+        self._3d_structure = None
+        self._3d_chain = geometry.to_biopython_chain()
+        return True
+
+    def __save_snapshot(self, preferred_sequence, load_options, ambiguous):
+        if self.snapshots is None:
+            return
+
+        self.snapshots.save(
+            self.__cache_key__, ChainGeometry.from_biopython_chain(self._3d_chain), self.structure_file, load_options,
+            preferred_sequence=preferred_sequence, ambiguous=ambiguous)
 
     def get_residue_count(self) -> int:
         return len(self.get_residue_list())
@@ -83,6 +150,14 @@ class Chain3dStructure:
             n_nearest: int = 10,
             distance_func='alpha_atoms') -> List[int]:
 
+        if (residue_index, n_nearest, distance_func) in self._nearest_memo:
+            return self._nearest_memo[(residue_index, n_nearest, distance_func)]
+
+        if distance_func == 'alpha_atoms':
+            distances = self.__alpha_atoms_distances_sq([residue_index])[0]
+
+            return [int(i) for i in np.argsort(distances, kind='stable')[:n_nearest]]
+
         if distance_func in DistancesCollection.names_to_functions:
             distance_func = DistancesCollection.names_to_functions[distance_func] 
 
@@ -100,9 +175,52 @@ class Chain3dStructure:
 
         return list([residue_index for residue_index, dist in distances[:n_nearest]])
 
+    def get_nearest_residue_matrix(
+            self,
+
+            # do not change these default values as some values may be stored in cache (alternatively delete cache)
+            n_nearest: int = 10,
+            distance_func='alpha_atoms',
+            rows_per_batch: int = 1024) -> ndarray:
+        # row `i` equals to `get_nearest_residue_indexes(i, n_nearest, distance_func)`
+
+        residue_count = self.get_residue_count()
+
+        if distance_func != 'alpha_atoms':
+            return np.array([
+                self.get_nearest_residue_indexes(i, n_nearest=n_nearest, distance_func=distance_func)
+                for i in range(residue_count)
+            ], dtype=np.int64).reshape(residue_count, -1)
+
+        nearest = np.empty((residue_count, min(n_nearest, residue_count)), dtype=np.int64)
+
+        # the full distance matrix of big chains would not fit into memory
+        for start in range(0, residue_count, rows_per_batch):
+            rows = range(start, min(start + rows_per_batch, residue_count))
+            distances = self.__alpha_atoms_distances_sq(rows)
+
+            # stable sort keeps the order of residues with the same distance as in the per residue version
+            nearest[start:start + len(rows)] = np.argsort(distances, axis=1, kind='stable')[:, :n_nearest]
+
+        # following `get_nearest_residue_indexes` calls (e.g. when filling the cache) do not need to recompute anything
+        for i in range(residue_count):
+            self._nearest_memo[(i, n_nearest, distance_func)] = [int(j) for j in nearest[i]]
+
+        return nearest
+
     def free_memory(self):
         self._3d_structure = None
         self._3d_chain = None
+        self._alpha_carbon_coords = None
+        self._protrusion_memo = {}
+        self._nearest_memo = {}
+
+    def __alpha_atoms_distances_sq(self, row_indexes) -> ndarray:
+        if self._alpha_carbon_coords is None:
+            self._alpha_carbon_coords = ResidueDistances.alpha_carbon_coords(self.get_residue_list())
+
+        coords, has_alpha_carbon = self._alpha_carbon_coords
+        return ResidueDistances.alpha_atoms_distances_sq(coords, has_alpha_carbon, row_indexes)
 
     def get_residue_list(self) -> List[Residue]: 
         return Chain3dStructure.get_chain_residue_list(self._3d_chain) 
@@ -125,6 +243,11 @@ class Chain3dStructure:
             # do not change this default value as some values may be stored in cache (alternatively delete cache)
             protrusion_algorithm='atom_count_from_center_of_mass'):
         
+        memo_key = (radius, protrusion_algorithm)
+
+        if memo_key in self._protrusion_memo:
+            return self._protrusion_memo[memo_key]
+
         if protrusion_algorithm in ProtrusionFunctionsCollection.names_to_functions:
             protrusion_algorithm = ProtrusionFunctionsCollection.names_to_functions[protrusion_algorithm] 
 
@@ -137,6 +260,34 @@ class Chain3dStructure:
             value = protrusion_algorithm(ns, residue, radius)
             protrusion.append(value)
 
+        # the per radius columns of `get_protrusion_matrix` of algorithms without a matrix function
+        self._protrusion_memo[memo_key] = protrusion
+
+        return protrusion
+
+    def get_protrusion_matrix(
+            self, radii,
+            # do not change this default value as some values may be stored in cache (alternatively delete cache)
+            protrusion_algorithm='atom_count_from_center_of_mass') -> ndarray:
+        # column `j` equals to `get_protrusion_vector(radii[j], protrusion_algorithm)`
+
+        if len(radii) > 0 and all((radius, protrusion_algorithm) in self._protrusion_memo for radius in radii):
+            return np.column_stack([self._protrusion_memo[(radius, protrusion_algorithm)] for radius in radii])
+
+        if protrusion_algorithm not in ProtrusionFunctionsCollection.names_to_matrix_functions:
+            return np.column_stack([
+                self.get_protrusion_vector(radius, protrusion_algorithm=protrusion_algorithm)
+                for radius in radii
+            ])
+
+        matrix_function = ProtrusionFunctionsCollection.names_to_matrix_functions[protrusion_algorithm]
+        protrusion = matrix_function(
+            list(self._3d_chain.get_atoms()), self.get_residue_list(), radii)
+
+        # following `get_protrusion_vector` calls (e.g. when filling the cache) do not need to recompute anything
+        for j, radius in enumerate(radii):
+            self._protrusion_memo[(radius, protrusion_algorithm)] = protrusion[:, j].tolist()
+
         return protrusion
     
     def get_SASA_vector(self):
@@ -161,35 +312,63 @@ class Chain3dStructure:
 allowed_file_types = ['pdb', 'ent', 'cif']
 
 class PdbFilesDb:
-    def __init__(self, storage_folder=config.pdbs_folder):
-        all_files = self.__list_files(storage_folder)
-        self.file_list = [file for file in all_files if file[-3:] in allowed_file_types]
+    def __init__(self, storage_folder=config.pdbs_folder, 
+                 snapshots_folder=config.structure_snapshots_folder,
+                 index_file=config.pdbs_index_file,
+                 rebuild_index=False):
+        # set `snapshots_folder` to None to always parse the original files
+        self.snapshots = StructureSnapshots(snapshots_folder) if snapshots_folder is not None else None
 
         self.protein_id_parsers = self.__get_protein_id_parsers()
 
-        self.protein_ids_to_file_mappings = self.__get_protein_id_to_files_mapping(self.file_list)
+        # set `index_file` to None to always walk the storage folder
+        self.index = PdbFilesIndex(index_file) if index_file is not None else None
+        content = self.index.load(storage_folder) if self.index is not None and not rebuild_index else None
+
+        if content is None:
+            content = self.__build_index(storage_folder)
+
+        self.protein_ids_to_file_mappings = content['protein_files']
+        self.chain_files = content['chain_files']
+        self.protein_fallback_files = content['fallback_files']
+
+        self.file_list = [file for files in self.protein_ids_to_file_mappings.values() for file in files]
+
+    def __build_index(self, storage_folder) -> dict:
+        all_files, directories = PdbFilesIndex.walk(storage_folder)
+        file_list = [file for file in all_files if file[-3:] in allowed_file_types]
+
+        protein_files = self.__get_protein_id_to_files_mapping(file_list)
+
+        content = {
+            'protein_files': protein_files,
+            'chain_files': self.__get_chain_files(protein_files),
+            'fallback_files': self.__get_fallback_files(protein_files),
+        }
+
+        if self.index is not None:
+            self.index.save(storage_folder, directories, content)
+
+        return content
 
     def get_file_name_for(self, protein_id: str, chain_id) -> str: 
-        potential_files = self.protein_ids_to_file_mappings[protein_id]
+        if protein_id not in self.protein_ids_to_file_mappings:
+            raise KeyError(protein_id)
 
         full_id = f'{protein_id}{chain_id}'.lower()
-        other_file = None
 
-        for file in potential_files:
-            if full_id in file.lower():
-                return file
-            
-            if file.endswith('ent') or file.endswith('cif'):
-                other_file = file
+        if full_id in self.chain_files:
+            return self.chain_files[full_id]
 
-        return other_file
+        return self.protein_fallback_files.get(protein_id)
 
     def get_chain_structure(self, protein_id, chain_id) -> Chain3dStructure: 
         structure_file = self.get_file_name_for(protein_id, chain_id)
         return Chain3dStructure(protein_id=protein_id, 
                                 chain_id=chain_id,
                                 structure_filename=structure_file,
-                                load=False)
+                                load=False,
+                                snapshots=self.snapshots)
 
     def __get_protein_id_parsers(self):
         def get_id_from_pdb(fname):
@@ -223,13 +402,28 @@ class PdbFilesDb:
 
         return mappings
 
+    def __get_chain_files(self, protein_files):
+        # chain specific files are named `<protein_id><chain_id>.pdb`,
+        # the first file found for the chain wins (as the former scan of the protein files did)
+        chain_files = {}
+
+        for files in protein_files.values():
+            for file in files:
+                if file.endswith('pdb'):
+                    chain_files.setdefault(file[-9:-4].lower(), file)
+
+        return chain_files
+
+    def __get_fallback_files(self, protein_files):
+        # whole structure of the protein is used if there is no file for the chain
+        fallback_files = {}
 
-    def __list_files(self, folder):
-        file_list = []
-        for root, dirs, files in os.walk(folder):
+        for id, files in protein_files.items():
             for file in files:
-                file_list.append(os.path.join(root, file))
-        return file_list
+                if file.endswith('ent') or file.endswith('cif'):
+                    fallback_files[id] = file
+
+        return fallback_files
 
 
 class AminoAcidMapper:
@@ -261,6 +455,34 @@ class ResidueDistances:
 
         return sum((a - b) * (a - b) for a, b in zip(coord_1, coord_2))
 
+    @staticmethod
+    def alpha_carbon_coords(residue_list: List[Residue]) -> tuple[ndarray, ndarray]:
+        has_alpha_carbon = np.array(['CA' in residue for residue in residue_list], dtype=bool)
+        coords = np.zeros((len(residue_list), 3), dtype=np.float32)
+
+        for i, residue in enumerate(residue_list):
+            if has_alpha_carbon[i]:
+                coords[i] = residue['CA'].get_coord()
+
+        return coords, has_alpha_carbon
+
+    @staticmethod
+    def alpha_atoms_distances_sq(coords: ndarray, has_alpha_carbon: ndarray, row_indexes) -> ndarray:
+        # distances between residues `row_indexes` and all residues, the arithmetic follows
+        # `distance_between_alpha_atoms_sq` exactly (float32), missing CA (sys.maxsize there) is infinity here
+        row_indexes = np.asarray(row_indexes, dtype=np.int64)
+        diff = coords[row_indexes, None, :] - coords[None, :, :]
+
+        distances = diff[:, :, 0] * diff[:, :, 0]
+        distances += diff[:, :, 1] * diff[:, :, 1]
+        distances += diff[:, :, 2] * diff[:, :, 2]
+
+        distances = distances.astype(np.float64)
+        distances[~has_alpha_carbon[row_indexes], :] = np.inf
+        distances[:, ~has_alpha_carbon] = np.inf
+
+        return distances
+
 class ProtrusionFunctions:
     @staticmethod
     def compute_neighboring_atoms_from_center(ns, residue, radius):
@@ -268,6 +490,45 @@ class ProtrusionFunctions:
         neighbors = ns.search(center=center, radius=radius, level='R') 
         return len(neighbors)
 
+    @staticmethod
+    def compute_neighboring_atoms_from_center_for_all_radii(all_atoms, residues, radii) -> ndarray:
+        # same as `compute_neighboring_atoms_from_center` for each residue and radius but the neighbors
+        # are searched only once for the biggest radius; the distances are computed in the same way
+        # as in the Biopython KDTree (squared, double precision) so the results are identical
+        atom_coords = np.array([atom.get_coord() for atom in all_atoms], dtype=np.float64)
+
+        residue_ids = {}
+        atom_residues = np.array([
+            residue_ids.setdefault(id(atom.get_parent()), len(residue_ids)) for atom in all_atoms
+        ], dtype=np.int64)
+
+        radii_sq = np.array([radius * radius for radius in radii], dtype=np.float64)
+        max_radius = float(max(radii))
+
+        kdt = KDTree(atom_coords, 10)
+        protrusion = np.zeros((len(residues), len(radii)), dtype=np.int64)
+
+        for i, residue in enumerate(residues):
+            center = np.require(residue.center_of_mass(), dtype=np.float64)
+            atom_indexes = np.array([point.index for point in kdt.search(center, max_radius)], dtype=np.int64)
+
+            if len(atom_indexes) == 0:
+                continue
+
+            diff = atom_coords[atom_indexes] - center
+            distances_sq = diff[:, 0] * diff[:, 0]
+            distances_sq += diff[:, 1] * diff[:, 1]
+            distances_sq += diff[:, 2] * diff[:, 2]
+
+            # a residue is a neighbor from the distance of its closest atom on
+            order = np.argsort(distances_sq, kind='stable')
+            _, first_occurrences = np.unique(atom_residues[atom_indexes[order]], return_index=True)
+            residue_distances_sq = np.sort(distances_sq[order][first_occurrences])
+
+            protrusion[i] = np.searchsorted(residue_distances_sq, radii_sq, side='right')
+
+        return protrusion
+
 class DistancesCollection:
     names_to_functions = {
         'alpha_atoms': ResidueDistances.distance_between_alpha_atoms_sq
@@ -277,4 +538,9 @@ class ProtrusionFunctionsCollection:
     names_to_functions = {
         'atom_count_from_center_of_mass': ProtrusionFunctions.compute_neighboring_atoms_from_center
     }
+
+    # compute protrusion of all residues for multiple radii at once
+    names_to_matrix_functions = {
+        'atom_count_from_center_of_mass': ProtrusionFunctions.compute_neighboring_atoms_from_center_for_all_radii
+    }
         
\ No newline at end of file
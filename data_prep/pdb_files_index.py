@@ -0,0 +1,73 @@
+import json
+import os
+from typing import Dict, List, Tuple, Union
+
+# increase when the content of the index changes so that old indexes are rebuilt
+index_version = 1
+
+class PdbFilesIndex:
+    # listing of the structure folder stored in one JSON file, the listing is valid
+    # as long as none of the walked directories changed its modification time
+    # (adding, removing or renaming a file changes the mtime of its directory)
+    def __init__(self, index_file):
+        self.index_file = index_file
+
+    def load(self, storage_folder) -> Union[dict, None]:
+        if not os.path.exists(self.index_file):
+            return None
+
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            print(f'Warning: PDB files index {self.index_file} could not be read. It will be rebuilt.')
+            return None
+
+        if index.get('version') != index_version or \
+           index.get('storage_folder') != os.path.abspath(storage_folder):
+            return None
+
+        if not self.__directories_unchanged(index['directories']):
+            return None
+
+        return index['content']
+
+    def save(self, storage_folder, directories: Dict[str, int], content: dict):
+        index = {
+            'version': index_version,
+            'storage_folder': os.path.abspath(storage_folder),
+            'directories': directories,
+            'content': content,
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_file)), exist_ok=True)
+
+        # other jobs may read the index at the same time
+        tmp_file = f'{self.index_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+
+        os.replace(tmp_file, self.index_file)
+
+    @staticmethod
+    def walk(storage_folder) -> Tuple[List[str], Dict[str, int]]:
+        file_list = []
+        directories = {}
+
+        for root, dirs, files in os.walk(storage_folder):
+            directories[os.path.abspath(root)] = os.stat(root).st_mtime_ns
+
+            for file in files:
+                file_list.append(os.path.join(root, file))
+
+        return file_list, directories
+
+    def __directories_unchanged(self, directories: Dict[str, int]) -> bool:
+        for directory, mtime in directories.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+
+        return True
@@ -0,0 +1,28 @@
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config.config as config
+
+import pdb_files_db
+from datetime import timedelta
+
+# python3 /home/brabecm4/diplomka/protein-binding-sites/data_prep/pdb_files_rebuild_index.py
+
+parser = argparse.ArgumentParser(description='Rebuild the index of PDB files used by PdbFilesDb')
+parser.add_argument('--storage-folder', type=str, default=config.pdbs_folder, help='Folder with the structure files')
+parser.add_argument('--index-file', type=str, default=config.pdbs_index_file, help='Where the index is stored')
+args = parser.parse_args()
+
+start_time = time.time()
+
+# the folder is walked even if the stored index is still valid
+pdb_db = pdb_files_db.PdbFilesDb(
+    storage_folder=args.storage_folder, 
+    index_file=args.index_file, 
+    rebuild_index=True)
+
+elapsed_time_secs = time.time() - start_time
+
+print(f'Indexed {len(pdb_db.file_list)} files of {len(pdb_db.protein_ids_to_file_mappings)} proteins into {args.index_file} in {timedelta(seconds=elapsed_time_secs)}')
@@ -1,8 +1,11 @@
 import argparse
 import json
+import multiprocessing
 import os
 import re
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
 from file_cache import use_cache
@@ -34,6 +37,8 @@ parser.add_argument('--prots', type=str, nargs='+', help='List of proteins to re
 parser.add_argument('--start', type=int, help='Start protein index')
 parser.add_argument('--count', type=int, help='Count of proteins')
 
+parser.add_argument('--workers', type=int, default=1, help='Number of processes computing chains in parallel')
+
 args = parser.parse_args()
 
 protrusion_radii = list(np.arange(1.0, 10.5, 0.5))
@@ -100,6 +105,9 @@ def run_functions_to_cache(chain_structure: pdb_files_db.Chain3dStructure):
     # nearest residues #
     ####################
 
+    # computes all rows at once, the per residue calls below are then served from its results
+    chain_structure.get_nearest_residue_matrix()
+
     for res_i in range(residue_count):
         nearest = chain_structure.get_nearest_residue_indexes(res_i)
 
@@ -113,6 +121,15 @@ def run_functions_to_cache(chain_structure: pdb_files_db.Chain3dStructure):
     # protrusion #
     ##############
 
+    # computes all radii at once, the per radius calls below are then served from its results
+    chain_structure.get_protrusion_matrix(protrusion_radii)
+
+    for algorithm in protrusion_function_names:
+        chain_structure.get_protrusion_matrix(
+            protrusion_radii,
+            protrusion_algorithm=algorithm
+        )
+
     for radius in protrusion_radii:
 
         # the version with default algorithm
@@ -132,22 +149,73 @@ def run_functions_to_cache(chain_structure: pdb_files_db.Chain3dStructure):
             
     SASA_vector = chain_structure.get_SASA_vector()
 
-for i, chain in enumerate(all_chains):
-    print(f'\r{BLUE}[{chain.full_id():5}] computing chain {YELLOW}{i + 1:4}{BLUE} / {YELLOW}{len(all_chains)}{BLUE} ... remaining: {estimate_to_end(i, len(all_chains))}' + \
+def refresh_chain(chain_index):
+    chain = all_chains[chain_index]
+
+    try:
+        chain_structure = pdb_db.get_chain_structure(chain.protein_id(), chain.chain_id())
+
+        if not args.check_presence:
+            # for checking the presence of data in the cache all that is needed it to
+            # not load 3d file of the chain. If the method call misses, the program will fail
+            # as the chain below does not have data to compute with
+            chain_structure.load(preferred_sequence=chain.sequence())
+
+        # every chain is visited only once - no need to keep its cache in memory
+        with use_cache(chain_structure, data_folder=cache_storage, keep_in_memory=False) as cached_chain_structure:
+            run_functions_to_cache(cached_chain_structure)
+
+        chain_structure.free_memory()
+    except Exception as e:
+        return chain_index, f'{e}\n{traceback.format_exc()}'
+
+    return chain_index, None
+
+def print_progress(done_count, chain_index):
+    print(f'\r{BLUE}[{all_chains[chain_index].full_id():5}] computed chain {YELLOW}{done_count:4}{BLUE} / {YELLOW}{len(all_chains)}{BLUE} ... remaining: {estimate_to_end(done_count, len(all_chains))}' + \
             f' {RESET}', end=end_line, flush=True)
-    
-    chain_structure = pdb_db.get_chain_structure(chain.protein_id(), chain.chain_id())
 
-    if not args.check_presence:
-        # for checking the presence of data in the cache all that is needed it to
-        # not load 3d file of the chain. If the method call misses, the program will fail
-        # as the chain below does not have data to compute with
-        chain_structure.load(preferred_sequence=chain.sequence())
+def print_failure(chain_index, error):
+    print(f'\n{RED}[{all_chains[chain_index].full_id():5}] failed: {error}{RESET}', flush=True)
+
+failed_chains = []
+
+if args.workers <= 1:
+    for i, chain in enumerate(all_chains):
+        print(f'\r{BLUE}[{chain.full_id():5}] computing chain {YELLOW}{i + 1:4}{BLUE} / {YELLOW}{len(all_chains)}{BLUE} ... remaining: {estimate_to_end(i, len(all_chains))}' + \
+                f' {RESET}', end=end_line, flush=True)
+
+        _, error = refresh_chain(i)
+
+        if error is not None:
+            print_failure(i, error)
+            failed_chains.append(chain.full_id())
+
+            # a chain missing in cache is enough to know that the cache is not complete
+            if args.check_presence:
+                break
+else:
+    # the longest chains are submitted first so that no worker is left with a big chain at the very end,
+    # idle workers take the next chain from the queue as soon as they finish the previous one
+    chain_indexes = sorted(range(len(all_chains)), key=lambda i: len(all_chains[i].sequence()), reverse=True)
+
+    # forked workers inherit the loaded databases and chain records
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        futures = [executor.submit(refresh_chain, i) for i in chain_indexes]
+
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            chain_index, error = future.result()
+
+            if error is not None:
+                print_failure(chain_index, error)
+                failed_chains.append(all_chains[chain_index].full_id())
 
-    with use_cache(chain_structure, data_folder=cache_storage) as cached_chain_structure:
-        run_functions_to_cache(cached_chain_structure)
+            print_progress(done_count, chain_index)
 
-    chain_structure.free_memory()
+if len(failed_chains) > 0:
+    print(f'\n{RED}{len(failed_chains)} chains failed: {" ".join(sorted(failed_chains))}{RESET}', end='')
 
+print(f'\n{YELLOW}DONE{RESET}')
 
-print(f'\n{YELLOW}DONE{RESET}')
\ No newline at end of file
+if len(failed_chains) > 0:
+    sys.exit(1)
\ No newline at end of file
@@ -1,13 +1,16 @@
 import argparse
 import json
 import os
+import shutil
 import sys
+import tempfile
 import time
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
 import config.config as config
 
-from file_cache import use_cache
+from file_cache import use_cache, shared_file_caches
 import pdb_files_db
+from data_prep.structure_snapshots import StructureSnapshots
 import traceback
 import datasets_db
 from datetime import timedelta
@@ -77,6 +80,101 @@ def sequence_error_does_not_exceed_threshold():
 
     return True, f'({RED}{wrong_count}{GREEN} wrong out of {YELLOW}{total_count}{GREEN}) ... {wrong_count / total_count * 100:.2f} % wrong'
 
+def streaming_load_matches_full_parse():
+    all_chains = chains_db.get_all_chain_records()
+    start_time = time.time()
+
+    for i, chain in enumerate(all_chains):
+        print(f'\r{BLUE}[ ] {streaming_load_matches_full_parse.__name__} ... testing chain {YELLOW}{i}{BLUE} {RESET}', end='', flush=True)
+
+        structure_file = pdb_db.get_chain_structure(chain.protein_id(), chain.chain_id()).structure_file
+
+        # without snapshots so that both structures are really read from the file
+        streamed = pdb_files_db.Chain3dStructure(chain.protein_id(), chain.chain_id(), structure_file)
+        parsed = pdb_files_db.Chain3dStructure(chain.protein_id(), chain.chain_id(), structure_file)
+
+        streamed.load(preferred_sequence=chain.sequence())
+        parsed.load(preferred_sequence=chain.sequence(), streaming=False)
+
+        streamed_atoms = [(atom.get_full_id()[1:], atom.get_altloc(), list(atom.get_coord())) for atom in streamed._3d_chain.get_atoms()]
+        parsed_atoms = [(atom.get_full_id()[1:], atom.get_altloc(), list(atom.get_coord())) for atom in parsed._3d_chain.get_atoms()]
+
+        if streamed_atoms != parsed_atoms:
+            return False, f'Streamed chain {chain.full_id()} differs from the parsed one'
+
+    end_time = time.time()
+    elapsed_time_secs = end_time - start_time
+
+    return True, f'elapsed time: {timedelta(seconds=elapsed_time_secs)}'
+
+def snapshot_load_matches_full_parse():
+    all_chains = chains_db.get_all_chain_records()
+    start_time = time.time()
+
+    def atoms_of(chain_structure):
+        return [(atom.get_parent().get_id(), atom.get_parent().get_resname(), atom.get_name(), atom.element, list(atom.get_coord()))
+                for atom in chain_structure._3d_chain.get_atoms()]
+
+    with tempfile.TemporaryDirectory() as snapshots_folder:
+        snapshots = StructureSnapshots(snapshots_folder)
+
+        for i, chain in enumerate(all_chains):
+            print(f'\r{BLUE}[ ] {snapshot_load_matches_full_parse.__name__} ... testing chain {YELLOW}{i}{BLUE} {RESET}', end='', flush=True)
+
+            structure_file = pdb_db.get_chain_structure(chain.protein_id(), chain.chain_id()).structure_file
+
+            # the first structure stores the snapshot, the second one is rebuilt from it
+            stored = pdb_files_db.Chain3dStructure(chain.protein_id(), chain.chain_id(), structure_file, snapshots=snapshots)
+            restored = pdb_files_db.Chain3dStructure(chain.protein_id(), chain.chain_id(), structure_file, snapshots=snapshots)
+            parsed = pdb_files_db.Chain3dStructure(chain.protein_id(), chain.chain_id(), structure_file)
+
+            stored.load(preferred_sequence=chain.sequence())
+            snapshots_count = len(os.listdir(snapshots_folder))
+
+            restored.load(preferred_sequence=chain.sequence())
+            parsed.load(preferred_sequence=chain.sequence())
+
+            if len(os.listdir(snapshots_folder)) != snapshots_count:
+                return False, f'Chain {chain.full_id()} was not restored from its snapshot'
+
+            if atoms_of(restored) != atoms_of(parsed):
+                return False, f'Chain {chain.full_id()} restored from its snapshot differs from the parsed one'
+
+    end_time = time.time()
+    elapsed_time_secs = end_time - start_time
+
+    return True, f'elapsed time: {timedelta(seconds=elapsed_time_secs)}'
+
+def snapshot_is_not_used_for_changed_file_or_other_load_options():
+    chain = chains_db.get_all_chain_records()[0]
+    structure_file = pdb_db.get_chain_structure(chain.protein_id(), chain.chain_id()).structure_file
+
+    with tempfile.TemporaryDirectory() as folder:
+        snapshots_folder = os.path.join(folder, 'snapshots')
+        snapshots = StructureSnapshots(snapshots_folder)
+
+        copied_file = os.path.join(folder, os.path.basename(structure_file))
+        shutil.copyfile(structure_file, copied_file)
+
+        def load(**load_options):
+            chain_structure = pdb_files_db.Chain3dStructure(chain.protein_id(), chain.chain_id(), copied_file, snapshots=snapshots)
+            chain_structure.load(preferred_sequence=chain.sequence(), **load_options)
+
+            return len(os.listdir(snapshots_folder))
+
+        # every load which cannot use the existing snapshots stores a new one
+        counts = [load(), load(), load(all_models=True), load(streaming=False)]
+
+        source_stat = os.stat(copied_file)
+        os.utime(copied_file, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns + 1_000_000_000))
+
+        counts.append(load())
+
+        if counts != [1, 1, 2, 3, 4]:
+            return False, f'Unexpected numbers of snapshots {counts}'
+
+    return True, None
+
 def nearest_residues_does_not_raise_an_error():
     all_chains = chains_db.get_all_chain_records()
     start_time = time.time()
@@ -104,11 +202,39 @@ def nearest_residues_does_not_raise_an_error():
 
     return True, f'elapsed time: {timedelta(seconds=elapsed_time_secs)}'
 
+def nearest_residue_matrix_matches_nearest_residue_indexes():
+    all_chains = chains_db.get_all_chain_records()
+    start_time = time.time()
+
+    for i, chain in enumerate(all_chains):
+        print(f'\r{BLUE}[ ] {nearest_residue_matrix_matches_nearest_residue_indexes.__name__} ... testing chain {YELLOW}{i}{BLUE} {RESET}', end='', flush=True)
+
+        chain_structure = pdb_db.get_chain_structure(chain.protein_id(), chain.chain_id())
+        chain_structure.load(preferred_sequence=chain.sequence())
+
+        nearest_matrix = chain_structure.get_nearest_residue_matrix()
+
+        for res_i in range(chain_structure.get_residue_count()):
+            expected = chain_structure.get_nearest_residue_indexes(
+                res_i, distance_func=pdb_files_db.ResidueDistances.distance_between_alpha_atoms_sq)
+
+            if list(nearest_matrix[res_i]) != expected:
+                return False, f'Unexpected nearest residues of residue {res_i} in chain {chain.full_id()} - expected {expected}, got {list(nearest_matrix[res_i])}'
+
+        chain_structure.free_memory()
+
+    end_time = time.time()
+    elapsed_time_secs = end_time - start_time
+
+    return True, f'elapsed time: {timedelta(seconds=elapsed_time_secs)}'
+
 def nearest_residues_are_cashable():
     # remove all data in cache
     for file_name in os.listdir(path_to_test_cache):
         os.remove(os.path.join(path_to_test_cache, file_name))
 
+    shared_file_caches.clear()
+
     all_chains = chains_db.get_all_chain_records()[:10]
 
     times = [0, 0, 0]
@@ -147,7 +273,7 @@ def nearest_residues_are_cashable():
                 run_nearest_residues_test(run_index, cached_chain_structure)
 
         # cold cache test
-        with use_cache(chain_structure, data_folder=path_to_test_cache) as cached_chain_structure:
+        with use_cache(chain_structure, data_folder=path_to_test_cache, keep_in_memory=False) as cached_chain_structure:
             run_nearest_residues_test(2, cached_chain_structure)
                 
         chain_structure.free_memory()
@@ -208,6 +334,32 @@ def check_protrusion_does_not_throw_an_error():
 
     return True, f'elapsed time: {timedelta(seconds=elapsed_time_secs)}'    
 
+def protrusion_matrix_matches_protrusion_vectors():
+    all_chains = chains_db.get_all_chain_records()
+    radii = [1.0, 2.5, 4.0, 8.5, 10.0]
+    start_time = time.time()
+
+    for i, chain in enumerate(all_chains):
+        print(f'\r{BLUE}[ ] {protrusion_matrix_matches_protrusion_vectors.__name__} ... testing chain {YELLOW}{i}{BLUE} {RESET}', end='', flush=True)
+
+        chain_structure = pdb_db.get_chain_structure(chain.protein_id(), chain.chain_id())
+        chain_structure.load(preferred_sequence=chain.sequence())
+
+        # the vectors are computed before the matrix as the matrix would prefill them
+        expected_vectors = [chain_structure.get_protrusion_vector(radius=radius) for radius in radii]
+        protrusion_matrix = chain_structure.get_protrusion_matrix(radii)
+
+        for j, radius in enumerate(radii):
+            if list(protrusion_matrix[:, j]) != expected_vectors[j]:
+                return False, f'Unexpected protrusion of chain {chain.full_id()} for radius {radius}'
+
+        chain_structure.free_memory()
+
+    end_time = time.time()
+    elapsed_time_secs = end_time - start_time
+
+    return True, f'elapsed time: {timedelta(seconds=elapsed_time_secs)}'
+
 def check_SASA_vector_does_not_throw_an_error():
     all_chains = chains_db.get_all_chain_records()
     start_time = time.time()
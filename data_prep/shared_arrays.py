@@ -0,0 +1,122 @@
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Tuple, Union
+import numpy as np
+from numpy import ndarray
+
+# numpy arrays in shared memory - worker processes get only the small handle (name, shape, dtype)
+# and map the same memory instead of receiving a pickled copy of the whole matrix
+
+class SharedArray:
+    def __init__(self, name, shape: Tuple[int, ...], dtype: str):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+
+        self.memory: Union[SharedMemory, None] = None
+        self.owner = False
+
+        # tracked memory is removed by the resource tracker when the creating process ends without unlinking it
+        self.tracked = False
+
+    @staticmethod
+    def create(array: ndarray, name=None, track=True) -> 'SharedArray':
+        array = np.asarray(array)
+
+        shared = SharedArray.allocate(array.shape, array.dtype, name, track)
+        shared.attach()[...] = array
+
+        return shared
+
+    @staticmethod
+    def concatenate(arrays: List[ndarray], name=None) -> 'SharedArray':
+        # the arrays are copied into the shared memory directly, without a concatenated copy in between
+        arrays = [np.asarray(array) for array in arrays]
+
+        shared = SharedArray.allocate((sum(len(array) for array in arrays),) + arrays[0].shape[1:], arrays[0].dtype, name)
+        result = shared.attach()
+
+        offset = 0
+        for array in arrays:
+            result[offset:offset + len(array)] = array
+            offset += len(array)
+
+        return shared
+
+    @staticmethod
+    def allocate(shape: Tuple[int, ...], dtype, name=None, track=True) -> 'SharedArray':
+        # the creating process owns the memory and has to `unlink` it when no process needs it anymore,
+        # untracked memory outlives the creating process (until it is unlinked by any process)
+        dtype = np.dtype(dtype)
+        memory = SharedArray.__create(name, max(int(np.prod(shape)) * dtype.itemsize, 1), track)
+
+        shared = SharedArray(memory.name, shape, dtype.str)
+        shared.memory = memory
+        shared.owner = True
+        shared.tracked = track
+
+        return shared
+
+    def attach(self) -> ndarray:
+        if self.memory is None:
+            self.memory = SharedArray.__open(self.name)
+
+        return np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=self.memory.buf)
+
+    def close(self):
+        # all arrays returned by `attach` have to be released before
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
+
+    def unlink(self):
+        if self.memory is None:
+            self.memory = SharedArray.__open(self.name)
+
+        if not self.tracked and not hasattr(self.memory, '_track'):
+            # `unlink` of Python before 3.13 always unregisters the memory from the resource tracker
+            resource_tracker.register(self.memory._name, 'shared_memory')
+
+        self.memory.unlink()
+        self.close()
+
+    def __getstate__(self):
+        # only the handle is sent to other processes
+        return { 'name': self.name, 'shape': self.shape, 'dtype': self.dtype }
+
+    def __setstate__(self, state):
+        self.__init__(state['name'], state['shape'], state['dtype'])
+
+    @staticmethod
+    def __create(name, size, track) -> SharedMemory:
+        if track:
+            return SharedMemory(name=name, create=True, size=size)
+
+        try:
+            # Python 3.13+
+            return SharedMemory(name=name, create=True, size=size, track=False)
+        except TypeError:
+            pass
+
+        memory = SharedMemory(name=name, create=True, size=size)
+        resource_tracker.unregister(memory._name, 'shared_memory')
+
+        return memory
+
+    @staticmethod
+    def __open(name) -> SharedMemory:
+        try:
+            # Python 3.13+
+            return SharedMemory(name=name, track=False)
+        except TypeError:
+            pass
+
+        # older versions register also the attached memory in the resource tracker, which would remove it
+        # when an attaching process that does not share the tracker with the owner finishes
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+
+        try:
+            return SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
@@ -0,0 +1,144 @@
+import fcntl
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Tuple, Union
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config.config as config
+from data_prep.feature_store import FeatureStore, data_parts, feature_store_version
+from data_prep.shared_arrays import SharedArray
+import numpy as np
+from numpy import ndarray
+
+class SharedDatasets:
+    # results of `LigandDataset.get_train_test_data` shared by all jobs running on one node - the first job
+    # builds the matrices into shared memory and describes them by a JSON manifest in `folder` (node local),
+    # other jobs map the same memory as read-only arrays instead of building their own copy,
+    # the memory is kept until it is released (see `shared_datasets_release.py`) or the node restarts
+    def __init__(self, folder=config.shared_datasets_folder):
+        self.folder = folder
+
+        # the returned arrays are views into these
+        self.attached: List[SharedArray] = []
+
+        os.makedirs(folder, exist_ok=True)
+
+    def get(self, key, spec: dict, build: Callable[[], Tuple[ndarray, ...]]) -> Tuple[ndarray, ...]:
+        # `key` and `spec` are the same as of `FeatureStore` (`spec` has to describe the served embeddings),
+        # jobs asking for the same key wait until the first one builds the data
+        if FeatureStore.embedders_of(spec) and 'embeddings' not in spec:
+            raise ValueError(f'Spec of the shared dataset {key} does not describe its embeddings')
+
+        with self.__locked(key):
+            manifest = self.manifest_of(key)
+            data = self.__attach(manifest) if manifest is not None else None
+
+            if data is None:
+                manifest = self.__share(key, spec, build())
+                data = self.__attach(manifest)
+
+        return data
+
+    def keys(self) -> List[str]:
+        return sorted(file[:-len('.json')] for file in os.listdir(self.folder) if file.endswith('.json'))
+
+    def manifest_of(self, key) -> Union[dict, None]:
+        manifest_file = self.__manifest_file(key)
+
+        if not os.path.exists(manifest_file):
+            return None
+
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+
+    def release(self, key) -> bool:
+        # processes that already use the data keep their mapping, the memory is freed after they finish
+        with self.__locked(key):
+            manifest = self.manifest_of(key)
+
+            if manifest is None:
+                return False
+
+            for part in manifest['parts']:
+                SharedDatasets.__unlink(part['name'])
+
+            os.remove(self.__manifest_file(key))
+
+        return True
+
+    def __attach(self, manifest: dict) -> Union[Tuple[ndarray, ...], None]:
+        try:
+            shared_arrays = [SharedArray(part['name'], part['shape'], part['dtype']) for part in manifest['parts']]
+            views = [shared_array.attach() for shared_array in shared_arrays]
+        except FileNotFoundError:
+            # the memory was removed without the manifest (e.g. by cleaning of `/dev/shm` after a job)
+            return None
+
+        self.attached.extend(shared_arrays)
+
+        for view in views:
+            view.flags.writeable = False
+
+        return tuple(views)
+
+    @staticmethod
+    def is_outdated(manifest: dict) -> bool:
+        # keys of other versions are never asked for again (manifests before the version was recorded included)
+        return manifest.get('version') != feature_store_version
+
+    def __share(self, key, spec: dict, data: Tuple[ndarray, ...]) -> dict:
+        parts = []
+
+        for part, array in zip(data_parts, data):
+            name = f'protein_binding_sites.{key}.{part}'
+
+            # left by a job that did not finish the manifest
+            SharedDatasets.__unlink(name)
+
+            # the memory has to outlive the job that creates it
+            shared_array = SharedArray.create(array, name=name, track=False)
+            shared_array.close()
+
+            parts.append({ 'part': part, 'name': name, 'shape': list(np.shape(array)), 'dtype': shared_array.dtype })
+
+        manifest = {
+            'key': key,
+            'version': feature_store_version,
+            'spec': spec,
+            'parts': parts,
+            'bytes': sum(int(np.asarray(array).nbytes) for array in data),
+            'created': time.time(),
+            'pid': os.getpid(),
+        }
+
+        manifest_file = self.__manifest_file(key)
+        tmp_manifest_file = f'{manifest_file}.{os.getpid()}.tmp'
+
+        with open(tmp_manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+        os.replace(tmp_manifest_file, manifest_file)
+
+        return manifest
+
+    def __manifest_file(self, key):
+        return os.path.join(self.folder, f'{key}.json')
+
+    @contextmanager
+    def __locked(self, key):
+        with open(os.path.join(self.folder, f'{key}.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def __unlink(name):
+        try:
+            SharedArray(name, (0,), 'u1').unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,33 @@
+import argparse
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config.config as config
+
+from shared_datasets import SharedDatasets
+
+# python3 /home/brabecm4/diplomka/protein-binding-sites/data_prep/shared_datasets_release.py --list
+
+parser = argparse.ArgumentParser(description='List or release feature matrices shared in memory by the jobs on this node')
+parser.add_argument('--folder', type=str, default=config.shared_datasets_folder, help='Folder with the manifests of the shared datasets')
+parser.add_argument('--ligand', type=str, help='Release only the datasets of this ligand')
+parser.add_argument('--outdated', action='store_true', help='Only the datasets built by an older version (see `feature_store_version`)')
+parser.add_argument('--list', action='store_true', help='Only list the shared datasets')
+args = parser.parse_args()
+
+shared_datasets = SharedDatasets(folder=args.folder)
+
+keys = [key for key in shared_datasets.keys() if args.ligand is None or key.split('.')[0] == args.ligand]
+
+for key in keys:
+    manifest = shared_datasets.manifest_of(key)
+
+    if manifest is None or (args.outdated and not SharedDatasets.is_outdated(manifest)):
+        continue
+
+    print(f'{key}: {manifest["bytes"] / 2**20:.1f} MiB, shapes {[part["shape"] for part in manifest["parts"]]}')
+
+    if not args.list:
+        shared_datasets.release(key)
+
+print(f'{"Found" if args.list else "Released"} {len(keys)} shared datasets')
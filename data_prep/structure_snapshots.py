@@ -0,0 +1,149 @@
+import hashlib
+import os
+import warnings
+from typing import Union
+import numpy as np
+from numpy import ndarray
+from Bio.PDB.Atom import Atom
+from Bio.PDB.Chain import Chain
+from Bio.PDB.Residue import Residue
+from Bio.PDB.PDBExceptions import PDBConstructionWarning
+
+# one row per atom of the chain in the order of `chain.get_atoms()`,
+# residue columns are repeated for every atom so that one memory mapped file describes the whole chain
+chain_geometry_dtype = np.dtype([
+    ('coord', np.float32, (3,)),
+    ('bfactor', np.float32),
+    ('occupancy', np.float32),
+    ('serial_number', np.int32),
+    ('name', 'S6'),
+    ('fullname', 'S6'),
+    ('element', 'S2'),
+    ('residue_index', np.int32),
+    ('residue_name', 'S5'),
+    ('hetero_flag', 'S8'),
+    ('residue_number', np.int32),
+    ('insertion_code', 'S1'),
+])
+
+class ChainGeometry:
+    def __init__(self, chain_id: str, atoms: ndarray):
+        self.chain_id = chain_id
+        self.atoms = atoms
+
+    @staticmethod
+    def from_biopython_chain(chain: Chain):
+        atom_rows = []
+
+        for residue_index, residue in enumerate(chain):
+            hetero_flag, residue_number, insertion_code = residue.get_id()
+
+            for atom in residue:
+                atom_rows.append((
+                    atom.get_coord(),
+                    atom.get_bfactor() or 0.0,
+                    atom.get_occupancy() or 0.0,
+                    atom.get_serial_number() or 0,
+                    atom.get_name(),
+                    atom.get_fullname(),
+                    atom.element or '',
+                    residue_index,
+                    residue.get_resname(),
+                    hetero_flag,
+                    residue_number,
+                    insertion_code,
+                ))
+
+        return ChainGeometry(chain.id, np.array(atom_rows, dtype=chain_geometry_dtype))
+
+    def to_biopython_chain(self) -> Chain:
+        chain = Chain(self.chain_id)
+        residue = None
+
+        # whole columns are converted at once, accessing the rows of a memory mapped array one by one is slow
+        coords = np.array(self.atoms['coord'], dtype=np.float32)
+        columns = { name: self.atoms[name].tolist() for name in chain_geometry_dtype.names if name != 'coord' }
+
+        # the geometry was valid when it was stored - Biopython does not need to warn about it again
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', PDBConstructionWarning)
+
+            for i in range(len(coords)):
+                if residue is None or columns['residue_index'][i] != columns['residue_index'][i - 1]:
+                    residue_id = (
+                        columns['hetero_flag'][i].decode(),
+                        columns['residue_number'][i],
+                        columns['insertion_code'][i].decode() or ' ')
+
+                    residue = Residue(residue_id, columns['residue_name'][i].decode(), ' ')
+                    chain.add(residue)
+
+                element = columns['element'][i].decode()
+
+                residue.add(Atom(
+                    name=columns['name'][i].decode(),
+                    coord=coords[i],
+                    bfactor=columns['bfactor'][i],
+                    occupancy=columns['occupancy'][i],
+                    altloc=' ',
+                    fullname=columns['fullname'][i].decode(),
+                    serial_number=columns['serial_number'][i],
+                    element=element if element != '' else None))
+
+        return chain
+
+class StructureSnapshots:
+    # compact per-chain geometry stored next to each other in one folder,
+    # loading a snapshot replaces parsing of the whole PDB/mmCIF file - a snapshot is used only for
+    # the same version of the source file (its modification time and size) and the same load options
+    def __init__(self, folder):
+        self.folder = folder
+
+    def load(self, cache_key, chain_id, source_file, load_options: dict, preferred_sequence=None) -> Union[ChainGeometry, None]:
+        variant = StructureSnapshots.__variant_of(source_file, load_options)
+
+        if variant is None:
+            return None
+
+        for file in [self.__file_for(cache_key, variant), self.__file_for(cache_key, variant, preferred_sequence or '')]:
+            if os.path.exists(file):
+                atoms = np.load(file, mmap_mode='r', allow_pickle=False)
+                return ChainGeometry(chain_id, atoms)
+
+        return None
+
+    def save(self, cache_key, geometry: ChainGeometry, source_file, load_options: dict, preferred_sequence=None, ambiguous=False):
+        variant = StructureSnapshots.__variant_of(source_file, load_options)
+
+        if variant is None:
+            return
+
+        # if more chains could be selected, the choice depends on the preferred sequence
+        file = self.__file_for(cache_key, variant, preferred_sequence or '') if ambiguous else self.__file_for(cache_key, variant)
+
+        os.makedirs(self.folder, exist_ok=True)
+
+        tmp_file = f'{file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.save(f, geometry.atoms, allow_pickle=False)
+
+        os.replace(tmp_file, file)
+
+    @staticmethod
+    def __variant_of(source_file, load_options: dict) -> Union[str, None]:
+        try:
+            source_stat = os.stat(source_file)
+        except FileNotFoundError:
+            return None
+
+        options = ','.join(f'{name}={value}' for name, value in sorted(load_options.items()))
+        variant = f'{source_stat.st_mtime_ns}.{source_stat.st_size}.{options}'
+
+        return hashlib.sha1(variant.encode()).hexdigest()[:12]
+
+    def __file_for(self, cache_key, variant, preferred_sequence=None):
+        if preferred_sequence is None:
+            return os.path.join(self.folder, f'{cache_key}.{variant}.npy')
+
+        sequence_hash = hashlib.sha1(preferred_sequence.encode()).hexdigest()[:12]
+        return os.path.join(self.folder, f'{cache_key}.{variant}.{sequence_hash}.npy')
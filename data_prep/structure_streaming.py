@@ -0,0 +1,356 @@
+import re
+import warnings
+from typing import List
+import numpy as np
+from Bio.PDB.Chain import Chain
+from Bio.PDB.PDBExceptions import PDBConstructionException, PDBConstructionWarning
+from Bio.PDB.StructureBuilder import StructureBuilder
+
+# Reads only the atom records of the requested chain and feeds them to the Biopython `StructureBuilder`
+# the same way `PDBParser` and `MMCIFParser` do (disordered atoms and residues are therefore resolved identically).
+# Other chains are skipped without creating any objects and reading stops after the first model if only
+# the first model is requested.
+
+class UnsupportedStructureFile(Exception):
+    pass
+
+class StreamingChainLoader:
+    def __init__(self, structure_file):
+        self.structure_file = structure_file
+
+    def load_chains(self, chain_id, all_models=False) -> List[Chain]:
+        # returns all chains of the structure whose ID matches `chain_id` (case insensitive)
+        # in the same order as they would be found by iterating the fully parsed structure
+        builder = _FilteringBuilder(chain_id)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', PDBConstructionWarning)
+
+            with open(self.structure_file, 'r') as file:
+                if self.structure_file.endswith('cif'):
+                    _MMCIFAtomStream(builder, all_models).read(file)
+                else:
+                    _PDBAtomStream(builder, all_models).read(file)
+
+        return builder.found_chains()
+
+class _FilteringBuilder:
+    def __init__(self, chain_id):
+        self.chain_id = chain_id.lower()
+
+        self.builder = StructureBuilder()
+        self.builder.init_structure('streamed')
+        self.builder.init_seg(' ')
+
+        self.model_index = None
+        self.built_model_index = None
+        self.model_serial = None
+
+        self.current_chain_id = None
+        self.current_residue_id = None
+        self.current_resname = None
+
+    def is_wanted(self, chain_id):
+        return chain_id.lower() == self.chain_id
+
+    def start_model(self, model_index, model_serial=None):
+        self.model_index = model_index
+        self.model_serial = model_serial
+        self.current_chain_id = None
+        self.current_residue_id = None
+        self.current_resname = None
+
+    def skip_atom(self, chain_id):
+        # chain change has to be registered as the original parsers would register it
+        if self.current_chain_id != chain_id:
+            self.current_chain_id = chain_id
+            self.current_residue_id = None
+            self.current_resname = None
+
+    def add_atom(self, chain_id, residue_id, resname,
+                 name, coord, bfactor, occupancy, altloc, fullname, serial_number, element):
+        # models without any atom of the chain are not created at all
+        if self.built_model_index != self.model_index:
+            self.built_model_index = self.model_index
+            self.builder.init_model(self.model_index, self.model_serial)
+
+        if self.current_chain_id != chain_id:
+            self.current_chain_id = chain_id
+            self.builder.init_chain(chain_id)
+            self.current_residue_id = None
+            self.current_resname = None
+
+        hetero_flag, resseq, icode = residue_id
+
+        if self.current_residue_id != residue_id or self.current_resname != resname:
+            self.current_residue_id = residue_id
+            self.current_resname = resname
+
+            try:
+                self.builder.init_residue(resname, hetero_flag, resseq, icode)
+            except PDBConstructionException:
+                # the parsers ignore these errors in permissive mode
+                pass
+
+        try:
+            self.builder.init_atom(
+                name, coord, bfactor, occupancy, altloc, fullname, serial_number, element)
+        except PDBConstructionException:
+            pass
+
+    def found_chains(self) -> List[Chain]:
+        if self.built_model_index is None:
+            return []
+
+        return [chain for model in self.builder.get_structure() for chain in model]
+
+class _PDBAtomStream:
+    # mirrors `PDBParser._parse_coordinates`
+    def __init__(self, builder: _FilteringBuilder, all_models):
+        self.builder = builder
+        self.all_models = all_models
+
+    def read(self, file):
+        model_index = -1
+        model_open = False
+
+        for line in file:
+            record_type = line[0:6]
+
+            if record_type == 'ATOM  ' or record_type == 'HETATM':
+                if not model_open:
+                    # there was no explicit MODEL record
+                    model_index += 1
+                    model_open = True
+
+                    if model_index > 0 and not self.all_models:
+                        return
+
+                    self.builder.start_model(model_index)
+
+                self.__read_atom(line.rstrip('\n'), record_type)
+
+            elif record_type == 'MODEL ':
+                model_index += 1
+                model_open = True
+
+                if model_index > 0 and not self.all_models:
+                    return
+
+                try:
+                    serial_num = int(line[10:14])
+                except Exception:
+                    serial_num = 0
+
+                self.builder.start_model(model_index, serial_num)
+
+            elif record_type == 'ENDMDL':
+                model_open = False
+
+                if not self.all_models:
+                    return
+
+                self.builder.start_model(model_index)
+
+            elif record_type == 'END   ' or record_type == 'CONECT':
+                return
+
+    def __read_atom(self, line, record_type):
+        chain_id = line[21]
+
+        if not self.builder.is_wanted(chain_id):
+            self.builder.skip_atom(chain_id)
+            return
+
+        fullname = line[12:16]
+        split_list = fullname.split()
+        name = fullname if len(split_list) != 1 else split_list[0]
+
+        altloc = line[16]
+        resname = line[17:20].strip()
+
+        try:
+            serial_number = int(line[6:11])
+        except Exception:
+            serial_number = 0
+
+        resseq = int(line[22:26].split()[0])
+        icode = line[26]
+
+        if record_type == 'HETATM':
+            hetero_flag = 'W' if resname == 'HOH' or resname == 'WAT' else 'H'
+        else:
+            hetero_flag = ' '
+
+        try:
+            coord = np.array((float(line[30:38]), float(line[38:46]), float(line[46:54])), 'f')
+        except Exception:
+            raise PDBConstructionException(f'Invalid or missing coordinate(s) in line "{line}"') from None
+
+        try:
+            occupancy = float(line[54:60])
+        except Exception:
+            occupancy = None
+
+        try:
+            bfactor = float(line[60:66])
+        except Exception:
+            bfactor = 0.0
+
+        element = line[76:78].strip().upper()
+
+        self.builder.add_atom(
+            chain_id, (hetero_flag, resseq, icode), resname,
+            name, coord, bfactor, occupancy, altloc, fullname, serial_number, element)
+
+class _MMCIFAtomStream:
+    # mirrors `MMCIFParser._build_structure` (with authors' chain and residue IDs as the parser uses by default)
+    unassigned = {'.', '?'}
+    quoted_token = re.compile(r"'(.*?)'(?=\s|$)|\"(.*?)\"(?=\s|$)|(\S+)")
+
+    def __init__(self, builder: _FilteringBuilder, all_models):
+        self.builder = builder
+        self.all_models = all_models
+
+        self.columns = None
+        self.model_index = -1
+        self.model_serial = None
+
+    def read(self, file):
+        headers = []
+        in_loop = False
+        pending_tokens = []
+
+        for line in file:
+            if self.columns is None:
+                stripped = line.strip()
+
+                if stripped == 'loop_':
+                    in_loop = True
+                    headers = []
+                elif in_loop and stripped.startswith('_atom_site.'):
+                    headers.append(stripped)
+                elif in_loop and len(headers) > 0:
+                    self.columns = self.__get_columns(headers)
+                else:
+                    in_loop = in_loop and stripped.startswith('_')
+
+                if self.columns is None:
+                    continue
+
+            # end of the atom site loop
+            if line.startswith(('#', 'loop_', '_', 'data_')):
+                break
+
+            pending_tokens.extend(self.__tokenize(line))
+
+            if len(pending_tokens) < len(headers):
+                continue
+
+            should_continue = self.__read_atom(pending_tokens)
+            pending_tokens = []
+
+            if not should_continue:
+                break
+
+        if self.columns is None:
+            raise UnsupportedStructureFile(f'No atom site loop found in {file.name}')
+
+    def __get_columns(self, headers):
+        indexes = { header[len('_atom_site.'):]: i for i, header in enumerate(headers) }
+
+        def column(*names):
+            for name in names:
+                if name in indexes:
+                    return indexes[name]
+            return None
+
+        return {
+            'serial': column('id'),
+            'name': column('label_atom_id'),
+            'resname': column('label_comp_id'),
+            'element': column('type_symbol'),
+            'chain': column('auth_asym_id', 'label_asym_id'),
+            'x': column('Cartn_x'),
+            'y': column('Cartn_y'),
+            'z': column('Cartn_z'),
+            'altloc': column('label_alt_id'),
+            'icode': column('pdbx_PDB_ins_code'),
+            'bfactor': column('B_iso_or_equiv'),
+            'occupancy': column('occupancy'),
+            'group': column('group_PDB'),
+            'model': column('pdbx_PDB_model_num'),
+            'resseq': column('auth_seq_id', 'label_seq_id'),
+        }
+
+    def __tokenize(self, line):
+        if '"' not in line and "'" not in line:
+            return line.split()
+
+        return [single or double or plain
+                for single, double, plain in self.quoted_token.findall(line)]
+
+    def __read_atom(self, tokens) -> bool:
+        columns = self.columns
+
+        resseq = tokens[columns['resseq']]
+        if resseq == '.':
+            # non-existing residue ID - skipped by the parser as well
+            return True
+
+        if columns['model'] is not None:
+            model_serial = int(tokens[columns['model']])
+
+            if model_serial != self.model_serial:
+                self.model_serial = model_serial
+                self.model_index += 1
+
+                if self.model_index > 0 and not self.all_models:
+                    return False
+
+                self.builder.start_model(self.model_index, model_serial)
+        elif self.model_index < 0:
+            self.model_index = 0
+            self.builder.start_model(self.model_index)
+
+        chain_id = tokens[columns['chain']]
+
+        if not self.builder.is_wanted(chain_id):
+            self.builder.skip_atom(chain_id)
+            return True
+
+        resname = tokens[columns['resname']]
+
+        altloc = tokens[columns['altloc']]
+        if altloc in self.unassigned:
+            altloc = ' '
+
+        icode = tokens[columns['icode']]
+        if icode in self.unassigned:
+            icode = ' '
+
+        if tokens[columns['group']] == 'HETATM':
+            hetero_flag = 'W' if resname == 'HOH' or resname == 'WAT' else 'H'
+        else:
+            hetero_flag = ' '
+
+        try:
+            serial_number = int(tokens[columns['serial']])
+        except ValueError:
+            serial_number = tokens[columns['serial']]
+
+        coord = np.array((
+            float(tokens[columns['x']]),
+            float(tokens[columns['y']]),
+            float(tokens[columns['z']])), 'f')
+
+        name = tokens[columns['name']]
+        element = tokens[columns['element']].upper() if columns['element'] is not None else None
+
+        self.builder.add_atom(
+            chain_id, (hetero_flag, int(resseq), icode), resname,
+            name, coord,
+            float(tokens[columns['bfactor']]), float(tokens[columns['occupancy']]),
+            altloc, name, serial_number, element)
+
+        return True
@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics import matthews_corrcoef
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from estimators.basic import BasicNetwork
+from estimators.bypass import BypassedInputsNetwork
+from seed_network import seed_all
+
+# measures the speedup of `TrainerBase.set_acceleration` (mixed precision + torch.compile) against the eager
+# float32 training on synthetic data of the size of our datasets, runs on CPU only machines as well
+
+# python netws/benchmark_acceleration.py --samples 200000 --features 1280 --hidden-layers 256 256 32 --epochs 5
+
+parser = argparse.ArgumentParser(description='Benchmark of the accelerated training of the estimators')
+
+parser.add_argument('--samples', type=int, default=100000, help='Number of training samples')
+parser.add_argument('--features', type=int, default=1280, help='Size of a feature vector (ESM embeddings have 1280)')
+parser.add_argument('--hidden-layers', type=int, nargs='+', default=[256, 256, 32], help='List of hidden layer sizes')
+parser.add_argument('--bypassed-inputs', type=int, default=0, help='Benchmark `BypassedInputsNetwork` with this many bypassed inputs')
+parser.add_argument('--batch-size', type=int, default=1000, help='Size of one batch')
+parser.add_argument('--epochs', type=int, default=3, help='Number of epochs')
+parser.add_argument('--learning-rate', type=float, default=0.001, help='Learning rate')
+parser.add_argument('--no-mixed-precision', action='store_true', help='Only compile the model')
+parser.add_argument('--no-compile', action='store_true', help='Only use mixed precision')
+parser.add_argument('--seed', type=int, default=42, help='Seed of random.')
+
+args = parser.parse_args()
+print('args: ', args)
+
+def get_data():
+    rng = np.random.default_rng(args.seed)
+
+    X = rng.normal(size=(args.samples, args.features)).astype(np.float32)
+    weights = rng.normal(size=args.features).astype(np.float32)
+    y = (X @ weights + rng.normal(scale=np.sqrt(args.features), size=args.samples) > 2 * np.sqrt(args.features)).astype(int)
+
+    return X, y
+
+def get_model():
+    if args.bypassed_inputs > 0:
+        return BypassedInputsNetwork(
+            input_size=args.features, hidden_sizes=args.hidden_layers,
+            bypassed_inputs=args.bypassed_inputs,
+            learning_rate=args.learning_rate, epochs=args.epochs, batch_size=args.batch_size)
+
+    return BasicNetwork(
+        input_size=args.features, hidden_sizes=args.hidden_layers,
+        learning_rate=args.learning_rate, epochs=args.epochs, batch_size=args.batch_size)
+
+def measure(X, y, accelerated):
+    seed_all(args.seed)
+    model = get_model()
+
+    # the last incomplete batch would trigger a recompilation of the compiled model
+    model.set_drop_last()
+
+    if accelerated:
+        model.set_acceleration(mixed_precision=not args.no_mixed_precision, compiled=not args.no_compile)
+
+    start = time.perf_counter()
+    model.fit(X, y)
+    seconds = time.perf_counter() - start
+
+    return seconds, matthews_corrcoef(y, model.predict(X))
+
+X, y = get_data()
+print(f'device: {get_model().device}, positive samples: {y.mean():.3f}', flush=True)
+
+# the first fit warms up the kernels (and the compilation caches)
+eager_seconds, eager_mcc = measure(X, y, accelerated=False)
+eager_seconds, eager_mcc = measure(X, y, accelerated=False)
+print(f'eager:       {eager_seconds:8.2f} s, train MCC {eager_mcc:.4f}', flush=True)
+
+accelerated_seconds, accelerated_mcc = measure(X, y, accelerated=True)
+print(f'accelerated: {accelerated_seconds:8.2f} s, train MCC {accelerated_mcc:.4f} (first run, including compilation)', flush=True)
+
+accelerated_seconds, accelerated_mcc = measure(X, y, accelerated=True)
+print(f'accelerated: {accelerated_seconds:8.2f} s, train MCC {accelerated_mcc:.4f}', flush=True)
+
+print(f'speedup:     {eager_seconds / accelerated_seconds:8.2f}x')
@@ -13,6 +13,7 @@ from datetime import datetime
 from estimators.basic import BasicNetwork
 from estimators.bypass import BypassedInputsNetwork
 from estimators.partial import PartialInputNetwork
+from cross_validation import concatenate_offsets, paired_ttest_5x2cv_grouped
 from mlxtend.evaluate import paired_ttest_5x2cv
 from sklearn.metrics import matthews_corrcoef
 import data_prep.datasets_db as datasets
@@ -21,6 +22,7 @@ import pprint
 parser = argparse.ArgumentParser(description='Ligand binding sites model comparing')
 parser.add_argument('--ligand', type=str, help='Name of the ligand')
 parser.add_argument('--radius', type=float, help='Protrusion radius')
+parser.add_argument('--group-by-chain', action='store_true', help='Keep residues of one chain in the same half of the 5x2 splits.')
 args = parser.parse_args()
 
 protrusion_fname = '/home/brabecm4/diplomka/protein-binding-sites/data/3d_proc/protrusion.max-neighbors.big.json'
@@ -34,6 +36,10 @@ hidden_layers = [512, 256, 128]
 embedder = "ESM"
 radius=args.radius
 
+# p-values of the grouped splits are not comparable with the ungrouped ones
+if args.group_by_chain:
+    tag = tag + '__chains'
+
 seed_all(42)
 
 data_loader = None 
@@ -46,19 +52,21 @@ db.load_protrusion_data_file(protrusion_fname)
 
 ds = db.get_dataset_for(ligand)
 
-X_train, y_train, X_test, y_test = ds.get_train_test_data(
+X_train, y_train, X_test, y_test, train_offsets, test_offsets = ds.get_train_test_data(
     [datasets.DataAccessors.embeddings(embedder), datasets.DataAccessors.protrusion(radius)],
-    [datasets.Helpers.filter_chains_with_valid_3D_file]
+    [datasets.Helpers.filter_chains_with_valid_3D_file],
+    return_offsets=True
 )
 
-X_train = torch.tensor(X_train, dtype=torch.float32)
-y_train = torch.tensor(y_train, dtype=torch.float32)
+X = np.concatenate((X_train, X_test), axis=0)
+y = np.concatenate((y_train, y_test), axis=0)
 
-X_test = torch.tensor(X_test, dtype=torch.float32)
-y_test = torch.tensor(y_test, dtype=torch.float32)
+# with `--group-by-chain` the 5x2 splits keep residues of one chain together
+chain_offsets = concatenate_offsets(train_offsets, test_offsets)
 
-X = torch.cat((X_train, X_test), axis=0)
-y = torch.cat((y_train, y_test), axis=0)
+if not args.group_by_chain:
+    X = torch.tensor(X, dtype=torch.float32)
+    y = torch.tensor(y, dtype=torch.float32)
 
 print("defining estimators ...", flush=True)
 
@@ -126,9 +134,14 @@ def mcc_scorer(model, X, y):
 
 print("evaluating...")
 
-t, p = paired_ttest_5x2cv(
-    estimator1=model_1, estimator2=model_2, 
-    X=X, y=y.int(), scoring=mcc_scorer, random_seed=1)
+if args.group_by_chain:
+    t, p = paired_ttest_5x2cv_grouped(
+        estimator1=model_1, estimator2=model_2, 
+        X=X, y=y, offsets=chain_offsets, scoring=mcc_scorer, random_seed=1)
+else:
+    t, p = paired_ttest_5x2cv(
+        estimator1=model_1, estimator2=model_2, 
+        X=X, y=y.int(), scoring=mcc_scorer, random_seed=1)
 
 print('P-value: %.3f, t-Statistic: %.3f' % (p, t))
 
@@ -150,6 +163,7 @@ report = {
     'hidden_layers': hidden_layers,
     'embedder': embedder,
     'radius': radius,
+    'splits': 'grouped_by_chains' if args.group_by_chain else 'residues',
 }
 
 str_report = pprint.pformat(report, compact=True, width=100).replace("'",'"')
@@ -0,0 +1,112 @@
+import random
+from typing import Callable, Iterator, List, Tuple
+import numpy as np
+from numpy import ndarray
+from scipy import stats
+
+# splits of the cross validations as indexes into one matrix, estimators select the rows themselves
+# (see `indices` of `TrainerBase.fit` and `TrainerBase.predict`) so no fold is copied out of the matrix
+
+def repeated_2fold_indexes(count, iterations, seed=42) -> Iterator[Tuple[int, ndarray, ndarray]]:
+    # yields `(fold, train_indexes, test_indexes)`, both halves of every iteration are used for training once,
+    # the shuffle depends only on the number of rows - the halves are the same as if the rows themselves were shuffled
+    split_random = random.Random()
+    split_random.seed(seed)
+
+    for iteration in range(iterations):
+        indexes = list(range(count))
+        split_random.shuffle(indexes)
+
+        half = count // 2
+        first_half, second_half = np.array(indexes[:half]), np.array(indexes[half:])
+
+        yield 2 * iteration, first_half, second_half
+        yield 2 * iteration + 1, second_half, first_half
+
+# splits grouped by chains - residues of one chain are never both in the train and the test part
+# (neighboring residues share most of their features), folds are given by the chain offsets
+# returned by `get_train_test_data(..., return_offsets=True)` as `(start, end)` row ranges of whole chains
+
+def concatenate_offsets(*offsets: ndarray) -> ndarray:
+    # offsets of the chains of concatenated matrices (e.g. train and test data)
+    result = [np.zeros(1, dtype=np.int64)]
+
+    for chain_offsets in offsets:
+        result.append(chain_offsets[1:] + result[-1][-1])
+
+    return np.concatenate(result)
+
+def chain_ranges(offsets: ndarray) -> ndarray:
+    return np.column_stack((offsets[:-1], offsets[1:]))
+
+def ranges_to_indexes(ranges: ndarray) -> ndarray:
+    if len(ranges) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+def take_ranges(X, ranges: ndarray):
+    # rows of whole chains are contiguous, a fold is a concatenation of slices rather than a gather of rows
+    return np.concatenate([X[start:end] for start, end in ranges])
+
+def grouped_kfold_ranges(offsets: ndarray, folds, seed=42) -> Iterator[Tuple[int, ndarray, ndarray]]:
+    # yields `(fold, train_ranges, test_ranges)`
+    parts = _split_chains(offsets, folds, np.random.default_rng(seed))
+
+    for fold in range(folds):
+        train_ranges = np.concatenate([part for i, part in enumerate(parts) if i != fold])
+        yield fold, train_ranges[np.argsort(train_ranges[:, 0])], parts[fold]
+
+def repeated_grouped_2fold_ranges(offsets: ndarray, iterations, seed=42) -> Iterator[Tuple[int, ndarray, ndarray]]:
+    # yields `(fold, train_ranges, test_ranges)` like `repeated_2fold_indexes` (5x2 for 5 iterations)
+    rng = np.random.default_rng(seed)
+
+    for iteration in range(iterations):
+        first_half, second_half = _split_chains(offsets, 2, rng)
+
+        yield 2 * iteration, first_half, second_half
+        yield 2 * iteration + 1, second_half, first_half
+
+def repeated_grouped_2fold_indexes(offsets: ndarray, iterations, seed=42) -> Iterator[Tuple[int, ndarray, ndarray]]:
+    for fold, train_ranges, test_ranges in repeated_grouped_2fold_ranges(offsets, iterations, seed):
+        yield fold, ranges_to_indexes(train_ranges), ranges_to_indexes(test_ranges)
+
+def paired_ttest_5x2cv_grouped(estimator1, estimator2, X, y, offsets: ndarray,
+                               scoring: Callable, random_seed=None) -> Tuple[float, float]:
+    # the same test as `mlxtend.evaluate.paired_ttest_5x2cv` (returns `t, p`) on the chain grouped 5x2 splits
+    score_differences: List[float] = []
+
+    for _, train_ranges, test_ranges in repeated_grouped_2fold_ranges(offsets, iterations=5, seed=random_seed):
+        X_train, y_train = take_ranges(X, train_ranges), take_ranges(y, train_ranges)
+        X_test, y_test = take_ranges(X, test_ranges), take_ranges(y, test_ranges)
+
+        estimator1.fit(X_train, y_train)
+        estimator2.fit(X_train, y_train)
+
+        score_differences.append(scoring(estimator1, X_test, y_test) - scoring(estimator2, X_test, y_test))
+
+    differences = np.array(score_differences).reshape(5, 2)
+    variance_sum = ((differences - differences.mean(axis=1, keepdims=True)) ** 2).sum()
+
+    t_statistic = differences[0, 0] / np.sqrt(variance_sum / 5.0)
+    p_value = stats.t.sf(np.abs(t_statistic), 5) * 2.0
+
+    return float(t_statistic), float(p_value)
+
+def _split_chains(offsets: ndarray, parts, rng: np.random.Generator) -> List[ndarray]:
+    # chains in a random order are cut into parts of about the same number of residues,
+    # ranges of every part are sorted so that its rows are read sequentially
+    ranges = chain_ranges(offsets)
+    ranges = ranges[rng.permutation(len(ranges))]
+
+    lengths = ranges[:, 1] - ranges[:, 0]
+    chain_starts = np.cumsum(lengths) - lengths
+    chain_parts = np.minimum(chain_starts * parts // max(int(lengths.sum()), 1), parts - 1)
+
+    result = []
+
+    for part in range(parts):
+        part_ranges = ranges[chain_parts == part]
+        result.append(part_ranges[np.argsort(part_ranges[:, 0])])
+
+    return result
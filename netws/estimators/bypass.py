@@ -32,10 +32,14 @@ class BypassedInputsModel(nn.Module):
                 self.layers.append(nn.ReLU())
 
     def forward(self, x):
+        return self.layers[-1](self.forward_logits(x))
+
+    def forward_logits(self, x):
+        # output before the final sigmoid
         saved_inputs = x[:, -self.bypassed_inputs_count:] 
         x = x[:, :-self.bypassed_inputs_count]
 
-        for i, layer in enumerate(self.layers):
+        for i, layer in enumerate(self.layers[:-1]):
             is_last_layer = i == len(self.layers) - 2
 
             if is_last_layer:
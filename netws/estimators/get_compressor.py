@@ -1,7 +1,6 @@
 import torch
 from estimators.basic import BasicNetwork
 import torch.nn as nn
-from sklearn.preprocessing import StandardScaler
 
 def get_compressor_function(X, y, best_params_for_compressor):
     
@@ -21,9 +20,9 @@ def get_compressor_function(X, y, best_params_for_compressor):
     trained_embedder = nn.Sequential(*layers[:-2])
 
     def transform_embeddings(embeddings):
-        X = StandardScaler().fit_transform(embeddings)
-        X = torch.tensor(X, dtype=torch.float32).to('cuda')
+        # standardized by the statistics of the compressor's training data
+        X = compressor.standardize(embeddings)
         with torch.no_grad():
-            return trained_embedder(X.to('cuda'))[:,:].cpu()
+            return trained_embedder(X)[:,:].cpu()
         
     return transform_embeddings
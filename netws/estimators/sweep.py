@@ -0,0 +1,64 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__))))
+from typing import List
+import trainer_base
+
+class SweepTrainer:
+    # trains many estimators (e.g. `BasicNetwork`s with different hidden layers and learning rates) on the same
+    # data at once - the data are prepared once and every batch is shared by all the models, each model keeps
+    # its own optimizer, so the results are the same as if the models were trained one by one on these batches
+    def __init__(self, estimators: List[trainer_base.TrainerBase]):
+        self.estimators = estimators
+
+        first = estimators[0]
+
+        for estimator in estimators:
+            if (estimator.epochs, estimator.batch_size, estimator.device, estimator.drop_last) != \
+               (first.epochs, first.batch_size, first.device, first.drop_last):
+                raise ValueError(f'Estimator {estimator.name} does not share epochs, batch size, device or drop last with {first.name}')
+
+        self.verbose = False
+
+    def set_verbose(self):
+        self.verbose = True
+
+    def fit(self, X, y=None, indices=None):
+        first = self.estimators[0]
+
+        if (self.verbose):
+            print(f'info (sweep): fitting {len(self.estimators)} estimators...', flush=True)
+
+        batches, threshold_data = first._training_data(X, y, indices)
+
+        training = []
+
+        for estimator in self.estimators:
+            estimator._set_scaler(first.scaler_mean, first.scaler_std)
+            estimator._init_model()
+            training.append(estimator._training_forward())
+
+        if (self.verbose):
+            print('')
+
+        for epoch in range(first.epochs):
+            if (self.verbose):
+                first._print_progress(epoch)
+
+            for batch_X, batch_y in batches():
+                batch_X = first._standardize(batch_X)
+
+                losses = [estimator._train_step(forward, criterion, batch_X, batch_y)
+                          for estimator, (forward, criterion) in zip(self.estimators, training)]
+
+            for estimator, loss in zip(self.estimators, losses):
+                if estimator.epoch_callback is not None:
+                    estimator.epoch_callback(epoch, loss, estimator)
+
+        X_threshold, y_threshold, indices_threshold = threshold_data
+
+        for estimator in self.estimators:
+            estimator.optimize_threshold_for_mcc(X_threshold, y_threshold, indices=indices_threshold)
+
+        return self.estimators
@@ -1,11 +1,9 @@
 import numpy as np
 from sklearn.base import BaseEstimator, RegressorMixin
-from sklearn.metrics import matthews_corrcoef
 from sklearn.utils.validation import check_X_y, check_array
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from sklearn.preprocessing import StandardScaler
 
 loading_bar_width = 25
 UP_char = "\033[A"
@@ -29,44 +27,50 @@ class TrainerBase(BaseEstimator, RegressorMixin):
         self.epoch_callback = None
         self.name = "BasicNetwork"
         self.verbose = False
+        self.drop_last = False
+        self.mixed_precision = False
+        self.compiled = False
         self.best_threshold = None
 
+        # standardization fitted on the training data, applied to all predicted data
+        self.scaler_mean = None
+        self.scaler_std = None
+
     def set_name(self, name):
         self.name = name
 
     def set_verbose(self):
         self.verbose = True
 
+    def set_drop_last(self, drop_last=True):
+        # the last incomplete batch of an epoch is skipped (if there is at least one full batch)
+        self.drop_last = drop_last
+
+    def set_acceleration(self, mixed_precision=True, compiled=True):
+        # opt-in faster training: autocast to bf16 (CPU) or fp16 (CUDA) and `torch.compile` of the model,
+        # a final sigmoid is then merged into the loss (`BCEWithLogitsLoss`) which is safe in low precision
+        # (predictions are still computed by the eager float32 model)
+        self.mixed_precision = mixed_precision
+        self.compiled = compiled
+
     def get_name(self):
         return self.name
 
     def register_epoch_callback(self, callback):
         self.epoch_callback = callback
 
-    def fit(self, X, y):
-        orig_X = X
+    def fit(self, X, y=None, indices=None):
+        # `X` is either a matrix with labels `y` or chunked data (see `data_prep/chunked_data.py`)
+        # that do not have to fit into memory - they are read chunk by chunk and moved to the device per batch,
+        # `indices` select the rows of the matrix to train on without copying them out of the whole matrix
         if (self.verbose):
             print(f'info ({self.name}): fitting...', flush=True)
 
-        # Input validation
-        X, y = check_X_y(X, y)
-
-        # Standardize input data
-        scaler = StandardScaler()
-        X = scaler.fit_transform(X)
-
-        # Convert numpy arrays to PyTorch tensors
-        X_tensor = torch.tensor(X, dtype=torch.float32).to(self.device)
-        y_tensor = torch.tensor(y, dtype=torch.float32).view(-1, 1).to(self.device)
-
-        # Define a PyTorch DataLoader for batching
-        dataset = torch.utils.data.TensorDataset(X_tensor, y_tensor)
-        dataloader = torch.utils.data.DataLoader(
-            dataset, 
-            batch_size=self.batch_size, shuffle=True)
+        batches, threshold_data = self._training_data(X, y, indices)
 
         # Reset sequential model
         self._init_model()
+        forward, criterion = self._training_forward()
 
         if (self.verbose):
             print('')
@@ -74,69 +78,302 @@ class TrainerBase(BaseEstimator, RegressorMixin):
         # Training loop
         for epoch in range(self.epochs):
             if (self.verbose):
-                bar_count = int((epoch + 1) * loading_bar_width / self.epochs)
-                space_count = loading_bar_width - bar_count
-                print(f'\r{UP_char} ({self.name}) epoch ({(epoch + 1):3d}/{self.epochs:3d}) [{"="*bar_count}{" "*space_count}]', flush=True)
+                self._print_progress(epoch)
             
-            for batch_X, batch_y in dataloader:
-                # Zero the gradients
-                self.optimizer.zero_grad()
-
-                # Forward pass
-                predictions = self.model(batch_X)
-                loss = self.criterion(predictions, batch_y)
-
-                # Backward pass and optimization
-                loss.backward()
-                self.optimizer.step()
+            for batch_X, batch_y in batches():
+                loss = self._train_step(forward, criterion, self._standardize(batch_X), batch_y)
 
             if self.epoch_callback is not None:
                 self.epoch_callback(epoch, loss, self)
 
-        self.optimize_threshold_for_mcc(orig_X, y)
+        X_threshold, y_threshold, indices_threshold = threshold_data
+        self.optimize_threshold_for_mcc(X_threshold, y_threshold, indices=indices_threshold)
 
         return self
+
+    def _training_data(self, X, y, indices=None):
+        # fits the standardization and returns a factory of the batches of one epoch 
+        # and the data for the threshold optimization (X, y, indices)
+        if self._is_chunked(X):
+            if indices is not None:
+                raise ValueError('Indices can be used only with a matrix')
+
+            # Standardization parameters, data are standardized per batch
+            self._set_scaler(*self._column_mean_and_std(X_chunk for X_chunk, _ in X.chunks()))
+
+            return lambda: self._chunked_batches(X), (X, X.labels(), None)
+
+        orig_X = X
+
+        # Input validation
+        if indices is None:
+            X, y = check_X_y(X, y, dtype=[np.float32, np.float16, np.float64])
+            y_selected = y
+        else:
+            X = check_array(X, dtype=[np.float32, np.float16, np.float64])
+            y = np.asarray(y)
+            indices = np.asarray(indices)
+            y_selected = y[indices]
+
+        # Standardization parameters, data are standardized per batch
+        self._set_scaler(*self._column_mean_and_std(self._row_chunks(X, indices=indices)))
+
+        if indices is not None and self.device == 'cpu':
+            # rows of batches are gathered from `X` itself, a matrix shared by more processes
+            # (e.g. `SharedDatasets`) stays the only copy of the data in memory
+            return lambda: self._indexed_batches(X, y, indices), (orig_X, y, indices)
+
+        # Convert numpy arrays to PyTorch tensors (half precision data stay in half precision)
+        X_tensor = self._rows_to_tensor(X, indices)
+        y_tensor = torch.tensor(y_selected, dtype=torch.float32).view(-1, 1).to(self.device)
+
+        # Batches are sliced directly from the tensors on the device (no per sample collating)
+        return lambda: self._dense_batches(X_tensor, y_tensor), (orig_X, y, indices)
+
+    def _train_step(self, forward, criterion, batch_X, batch_y):
+        # Zero the gradients
+        self.optimizer.zero_grad()
+
+        # Forward pass (loss is computed in float32 even in mixed precision)
+        with self._autocast():
+            predictions = forward(batch_X)
+
+        loss = criterion(predictions.float(), batch_y)
+
+        # Backward pass and optimization (the gradient scaler is active only for fp16)
+        self.grad_scaler.scale(loss).backward()
+        self.grad_scaler.step(self.optimizer)
+        self.grad_scaler.update()
+
+        return loss
+
+    def _print_progress(self, epoch):
+        bar_count = int((epoch + 1) * loading_bar_width / self.epochs)
+        space_count = loading_bar_width - bar_count
+        print(f'\r{UP_char} ({self.name}) epoch ({(epoch + 1):3d}/{self.epochs:3d}) [{"="*bar_count}{" "*space_count}]', flush=True)
     
-    def optimize_threshold_for_mcc(self, X, y):
-        y_pred_raw = self.predict_raw(X)
-        best_mcc = -1
+    def optimize_threshold_for_mcc(self, X, y, thresholds=None, indices=None):
+        # MCC of all thresholds computed at once from one sort of the predictions,
+        # any grid of thresholds can be used (the first threshold with the best MCC wins)
+        if thresholds is None:
+            thresholds = np.arange(0.0, 1.0, 0.05)
 
-        for threshold in np.arange(0.0, 1.0, 0.05):
-            pred = (np.array(y_pred_raw) >= threshold).astype(int)
-            mcc = matthews_corrcoef(y, pred)
+        y_pred_raw = np.asarray(self.predict_raw(X, indices=indices))
+        y = np.asarray(y) if indices is None else np.asarray(y)[indices]
 
-            if mcc > best_mcc:
-                best_mcc = mcc
-                self.best_threshold = threshold
+        order = np.argsort(y_pred_raw, kind='stable')
+        sorted_predictions = y_pred_raw[order]
+        positives_below = np.concatenate(([0], np.cumsum(y[order] == 1)))
 
-    def predict(self, X):
-        predictions = self.predict_raw(X)
+        # number of samples predicted as negative (prediction < threshold) for every threshold
+        negative_predictions = np.searchsorted(sorted_predictions, thresholds, side='left')
+
+        false_negatives = positives_below[negative_predictions].astype(np.float64)
+        true_negatives = negative_predictions - false_negatives
+        true_positives = positives_below[-1] - false_negatives
+        false_positives = (len(y) - negative_predictions) - true_positives
+
+        numerator = true_positives * true_negatives - false_positives * false_negatives
+        denominator = np.sqrt(
+            (true_positives + false_positives) * (true_positives + false_negatives) *
+            (true_negatives + false_positives) * (true_negatives + false_negatives))
+
+        # sklearn defines MCC as 0 if any of the sums is 0
+        mcc = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+        self.best_threshold = thresholds[np.argmax(mcc)]
+
+    def predict(self, X, indices=None):
+        predictions = self.predict_raw(X, indices=indices)
 
         return (np.array(predictions) >= self.best_threshold).astype(int)
 
-    def predict_raw(self, X):
+    def predict_raw(self, X, indices=None):
         if (self.verbose):
             print(f'info ({self.name}): predicting...', flush=True)
 
+        if self.scaler_mean is None:
+            raise Exception(f'Estimator {self.name} has to be fitted before predicting')
+
+        if self._is_chunked(X):
+            if indices is not None:
+                raise ValueError('Indices can be used only with a matrix')
+
+            return torch.cat([self._predict_chunk(X_chunk) for X_chunk, _ in X.chunks()])
+
         # Input validation
-        X = check_array(X)
+        X = check_array(X, dtype=[np.float32, np.float16, np.float64])
+
+        # predicted chunk by chunk (selected rows are gathered chunk by chunk), so no tensor of the whole X is created
+        return torch.cat([self._predict_chunk(X_chunk) for X_chunk in self._row_chunks(X, indices=indices)])
 
-        # Standardize input data
-        X = StandardScaler().fit_transform(X)
-        X = torch.tensor(X, dtype=torch.float32).to(self.device)
+    def standardize(self, X):
+        # X standardized by the statistics of the training data as a tensor on the device
+        return self._standardize(self._to_tensor(np.asarray(X)))
+
+    def _predict_chunk(self, X):
+        # Standardize input data by the statistics of the training data
+        X = self.standardize(X)
 
         # Make predictions
         with torch.no_grad():
-            predictions = self.model(X.to(self.device))[:, 0].cpu()
+            predictions = self.model(X)[:, 0].cpu()
 
         return predictions
 
+    def _set_scaler(self, mean, std):
+        self.scaler_mean = mean
+        self.scaler_std = std
+
+        # (x - mean) / std computed as one fused x * scale + shift
+        self._scaler_scale = 1.0 / std
+        self._scaler_shift = -mean * self._scaler_scale
+
+    def _standardize(self, X_tensor):
+        return torch.addcmul(self._scaler_shift, X_tensor.float(), self._scaler_scale)
+
+    def _training_forward(self):
+        if not self.mixed_precision and not self.compiled:
+            return self.model, self.criterion
+
+        forward, criterion = self.model, self.criterion
+        logits_forward = self._logits_forward()
+
+        if logits_forward is not None:
+            forward, criterion = logits_forward, nn.BCEWithLogitsLoss()
+
+        if self.compiled:
+            forward = torch.compile(forward)
+
+        return forward, criterion
+
+    def _logits_forward(self):
+        # the model without its final sigmoid (sharing the parameters), None if it is not known how to strip it
+        if hasattr(self.model, 'forward_logits'):
+            return self.model.forward_logits
+
+        if isinstance(self.model, nn.Sequential) and isinstance(self.model[-1], nn.Sigmoid):
+            return self.model[:-1]
+
+        return None
+
+    def _autocast(self):
+        device_type = 'cuda' if self.device.startswith('cuda') else 'cpu'
+        dtype = torch.float16 if device_type == 'cuda' else torch.bfloat16
+
+        return torch.autocast(device_type=device_type, dtype=dtype, enabled=self.mixed_precision)
+
+    def _is_chunked(self, X):
+        return hasattr(X, 'chunks')
+
+    def _row_chunks(self, X, rows_per_chunk=65536, indices=None):
+        if indices is None:
+            for start in range(0, len(X), rows_per_chunk):
+                yield X[start:start + rows_per_chunk]
+        else:
+            for start in range(0, len(indices), rows_per_chunk):
+                yield X[indices[start:start + rows_per_chunk]]
+
+    def _rows_to_tensor(self, X, indices=None, rows_per_chunk=65536):
+        if indices is None:
+            return self._to_tensor(X)
+
+        # the selected rows are copied to the device chunk by chunk, no copy of all of them is made on the host
+        tensor = torch.empty((len(indices), X.shape[1]), 
+                             dtype=torch.float16 if X.dtype == np.float16 else torch.float32, 
+                             device=self.device)
+
+        for start, X_chunk in zip(range(0, len(indices), rows_per_chunk), self._row_chunks(X, rows_per_chunk, indices)):
+            tensor[start:start + len(X_chunk)] = self._to_host_tensor(X_chunk)
+
+        return tensor
+
+    def _batch_starts(self, count):
+        if self.drop_last and count >= self.batch_size:
+            return range(0, count - self.batch_size + 1, self.batch_size)
+
+        return range(0, count, self.batch_size)
+
+    def _dense_batches(self, X_tensor, y_tensor):
+        # one permutation generated on the device per epoch, every batch gathers only its own rows
+        # (reordering the whole tensor at once would double the memory the data take on the device)
+        permutation = torch.randperm(len(X_tensor), device=X_tensor.device)
+
+        for start in self._batch_starts(len(X_tensor)):
+            batch_indexes = permutation[start:start + self.batch_size]
+
+            yield X_tensor[batch_indexes], y_tensor[batch_indexes]
+
+    def _indexed_batches(self, X, y, indices):
+        # the same batches as `_dense_batches` of the selected rows
+        permutation = indices[torch.randperm(len(indices)).numpy()]
+
+        for start in self._batch_starts(len(permutation)):
+            batch_indexes = permutation[start:start + self.batch_size]
+
+            yield self._to_host_tensor(X[batch_indexes]), torch.tensor(y[batch_indexes], dtype=torch.float32).view(-1, 1)
+
+    def _chunked_batches(self, data):
+        # shuffled within chunks (and the order of chunks if the data allow it)
+        for X_chunk, y_chunk in data.chunks(shuffle=True):
+            permutation = torch.randperm(len(X_chunk)).numpy()
+
+            for start in self._batch_starts(len(X_chunk)):
+                indexes = permutation[start:start + self.batch_size]
+
+                yield (self._host_to_device(self._to_host_tensor(X_chunk[indexes])), 
+                       self._host_to_device(torch.tensor(y_chunk[indexes], dtype=torch.float32).view(-1, 1)))
+
+    def _column_mean_and_std(self, X_chunks):
+        # same statistics as `StandardScaler` computes (population std, constant columns are not scaled)
+        # accumulated in float64 chunk by chunk so that no float64 copy of the whole X is needed
+        count = 0
+        mean = None
+        sum_of_squares = None
+
+        for chunk in X_chunks:
+            chunk = np.asarray(chunk, dtype=np.float64)
+            chunk_mean = chunk.mean(axis=0)
+
+            if mean is None:
+                mean = np.zeros(chunk.shape[1])
+                sum_of_squares = np.zeros(chunk.shape[1])
+
+            # merging of the partial results (Chan et al.)
+            delta = chunk_mean - mean
+            new_count = count + len(chunk)
+
+            mean = mean + delta * len(chunk) / new_count
+            sum_of_squares = sum_of_squares + ((chunk - chunk_mean) ** 2).sum(axis=0) + delta ** 2 * count * len(chunk) / new_count
+            count = new_count
+
+        std = np.sqrt(sum_of_squares / count)
+        std[std < 10 * np.finfo(np.float64).eps] = 1.0
+
+        return (torch.tensor(mean, dtype=torch.float32).to(self.device), 
+                torch.tensor(std, dtype=torch.float32).to(self.device))
+
+    def _to_tensor(self, X):
+        return self._to_host_tensor(X).to(self.device)
+
+    def _to_host_tensor(self, X):
+        dtype = torch.float16 if X.dtype == np.float16 else torch.float32
+        return torch.tensor(X, dtype=dtype)
+
+    def _host_to_device(self, tensor):
+        # batches read on the host are copied from pinned memory without blocking the training
+        if self.device == 'cpu':
+            return tensor
+
+        return tensor.pin_memory().to(self.device, non_blocking=True)
+
     def underling_model(self):
         return self.model
     
     def _init_model(self):
         self.model = self._get_model_to_train()
         self.optimizer = optim.Adam(self.model.parameters(), lr=self.learning_rate)
+        self.grad_scaler = torch.amp.GradScaler('cuda', enabled=self.mixed_precision and self.device.startswith('cuda'))
         self.model.to(self.device)
 
     def _get_model_to_train(self):
@@ -2,10 +2,11 @@ import torch
 import numpy as np
 from sklearn.metrics import matthews_corrcoef
 
-def get_statistics(model, X, y, epochs, print_res=False):
-    y_pred = model.predict(X)
+def get_statistics(model, X, y, epochs, print_res=False, indices=None):
+    # `indices` select the evaluated rows of `X` and `y` (see `TrainerBase.predict`)
+    y_pred = model.predict(X, indices=indices)
     
-    y = np.array(y).round()
+    y = np.array(y if indices is None else np.asarray(y)[indices]).round()
     y_pred = np.array(y_pred).round()
     accuracy = (y_pred == y).mean() * 100
     mcc = matthews_corrcoef(y, y_pred)
@@ -15,6 +15,7 @@ from estimators.basic import BasicNetwork
 from estimators.bypass import BypassedInputsNetwork
 import data_prep.datasets_db as dataset
 import data_prep.pdb_files_db as pdb_data
+from data_prep.feature_store import FeatureStore
 from evaluator import get_statistics
 import string
 from seed_network import seed_all 
@@ -63,6 +64,7 @@ pdb_db = pdb_data.PdbFilesDb()
 
 db = dataset.SeqDatasetDb()
 db.set_pdb_db(pdb_db)
+feature_store = FeatureStore()
 
 ds = db.get_dataset_for(args.ligand)
 
@@ -73,7 +75,8 @@ X_train_validate, y_train_validate, _, _ = ds.get_train_test_data(
     [
         dataset.DataAccessors.embeddings(args.embedder),
     ],
-    filters=[dataset.Helpers.filter_chains_with_valid_3D_file]
+    filters=[dataset.Helpers.filter_chains_with_valid_3D_file],
+    feature_store=feature_store
 )
 
 X_train, _, y_train, _ = train_test_split(
@@ -11,6 +11,7 @@ import config.config as config
 from estimators.basic import BasicNetwork
 import data_prep.datasets_db as dataset
 import data_prep.pdb_files_db as pdb_data
+from data_prep.feature_store import FeatureStore
 from seed_network import seed_all 
 from estimators.get_compressor import get_compressor_function
 
@@ -43,6 +44,7 @@ print ('loading data ...', flush=True)
 pdb_db = pdb_data.PdbFilesDb()
 db = dataset.SeqDatasetDb()
 db.set_pdb_db(pdb_db)
+feature_store = FeatureStore()
 ds = db.get_dataset_for(args.ligand)
 
 print ('loading data ...', flush=True)
@@ -56,7 +58,8 @@ neighbors = {
 
 X_train_validate, y_train_validate, X_test, y_test = ds.get_train_test_data(
     [dataset.DataAccessors.neighborhood_embeddings(embedder, neighbors)],
-    filters=[dataset.Helpers.filter_chains_with_valid_3D_file]
+    filters=[dataset.Helpers.filter_chains_with_valid_3D_file],
+    feature_store=feature_store
 )
 
 def get_model(input_size):
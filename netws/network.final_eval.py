@@ -1,24 +1,30 @@
 import argparse
 from datetime import datetime
 import json
+import multiprocessing
 import os
-import random
 import sys
 
 import numpy as np
 from sklearn.metrics import matthews_corrcoef
 from sklearn.model_selection import train_test_split
+import torch
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
 import config.config as config
 from estimators.basic import BasicNetwork
 from estimators.bypass import BypassedInputsNetwork
 import data_prep.datasets_db as dataset
 import data_prep.pdb_files_db as pdb_data
+from data_prep.feature_spec import FeatureSpec
+from data_prep.feature_store import FeatureStore
+from data_prep.shared_arrays import SharedArray
+from cross_validation import concatenate_offsets, repeated_2fold_indexes, repeated_grouped_2fold_indexes
 from seed_network import seed_all 
 from estimators.get_compressor import get_compressor_function
 
 
 # srun -p gpu-short --gres=gpu:V100 -A nprg058s --cpus-per-task=4 --mem-per-cpu=32G python /home/brabecm4/diplomka/protein-binding-sites/netws/network.final_eval.py --final-tag basic_v6 --ligand AMP
+# srun -p cpu-long -A nprg058s --cpus-per-task=20 --mem-per-cpu=8G python /home/brabecm4/diplomka/protein-binding-sites/netws/network.final_eval.py --final-tag basic_v6 --ligand AMP --workers 10
 
 allowed_ligands = dataset.SeqDatasetDb.all_ligands()
 embedder = 'ESM'
@@ -29,6 +35,8 @@ parser.add_argument('--final-tag', type=str, help='Tag the final result', requir
 parser.add_argument('--ligand', type=str, choices=allowed_ligands, help='Name of the ligand')
 
 parser.add_argument('--second-radius', type=float,  help='Second protrsuion radius')
+parser.add_argument('--workers', type=int, default=1, help='Number of processes running the folds of the cross validation in parallel (CPU only).')
+parser.add_argument('--group-by-chain', action='store_true', help='Keep residues of one chain in the same half of the cross validation splits.')
 
 args = parser.parse_args()
 print('args: ', args)
@@ -45,69 +53,46 @@ print ('loading data ...', flush=True)
 pdb_db = pdb_data.PdbFilesDb()
 db = dataset.SeqDatasetDb()
 db.set_pdb_db(pdb_db)
+feature_store = FeatureStore()
 ds = db.get_dataset_for(args.ligand)
 
 print ('defining model and data ...', flush=True)
 
 tags_with_bypassed_input = ['protrusion_bypass_v4_c', 'SASA_bypassed_v2_c']
 
-# modify if needed: 
-accessors = { 
-    'basic_v6': [
-        dataset.DataAccessors.embeddings(embedder)
-    ],
+# modify if needed (the specs are created only for the selected tag, e.g. the radius may be unset for others): 
+feature_spec = { 
+    'basic_v6': lambda: FeatureSpec(embedder),
     
-    'prot_all_c': [
-        dataset.DataAccessors.embeddings(embedder),
-        dataset.DataAccessors.protrusion(1.0,1.5,2.0,2.5,3.0,3.5,4.0,4.5,5.0,5.5,6.0,6.5,7.0,7.5,8.0,8.5,9.0,9.5,10.0),
-    ],
+    'prot_all_c': lambda: FeatureSpec(embedder, protrusion_radii=[1.0,1.5,2.0,2.5,3.0,3.5,4.0,4.5,5.0,5.5,6.0,6.5,7.0,7.5,8.0,8.5,9.0,9.5,10.0]),
     
-    'protrusion_bypass_v4_c': [
-        dataset.DataAccessors.embeddings(embedder),
-        dataset.DataAccessors.protrusion(hyper_params['radius']),
-    ],
-    'SASA_bypassed_v2_c': [
-        dataset.DataAccessors.embeddings(embedder),
-        dataset.DataAccessors.SASA_vector(),
-    ],
-
-    'neighboring_emb_5_v2_c': [
-        dataset.DataAccessors.neighborhood_embeddings(embedder, 5),
-    ],
-
-    'one_prot_fst_v3_c': [
-        dataset.DataAccessors.embeddings(embedder),
-        dataset.DataAccessors.protrusion(hyper_params['radius']),
-    ],
-
-    'SASA_fst_v2_c': [
-        dataset.DataAccessors.embeddings(embedder),
-        dataset.DataAccessors.SASA_vector(),
-    ],
-
-    'nei_emb_3_v2_c': [
-        dataset.DataAccessors.neighborhood_embeddings(embedder, 3),
-    ],
-
-    'nei_emb_5_avrg_v2_c': [
-        dataset.DataAccessors.average_neighborhood_embeddings(embedder, 5),
-    ],
-
-    'nei_emb_3_avrg_v2_c': [
-        dataset.DataAccessors.average_neighborhood_embeddings(embedder, 3),
-    ],
-
-    'two_prot_v2_c': [
-        dataset.DataAccessors.embeddings(embedder),
-        dataset.DataAccessors.protrusion(8.5),   
-        dataset.DataAccessors.protrusion(args.second_radius),   
-    ]
-}[args.final_tag]
-
-
-X_train_validate, y_train_validate, X_test, y_test = ds.get_train_test_data(
-    accessors,
-    filters=[dataset.Helpers.filter_chains_with_valid_3D_file]
+    'protrusion_bypass_v4_c': lambda: FeatureSpec(embedder, protrusion_radii=[hyper_params['radius']]),
+    'SASA_bypassed_v2_c': lambda: FeatureSpec(embedder, SASA=True),
+
+    'neighboring_emb_5_v2_c': lambda: FeatureSpec(embedder, aggregation='concat', neighbors_count=5),
+
+    'one_prot_fst_v3_c': lambda: FeatureSpec(embedder, protrusion_radii=[hyper_params['radius']]),
+
+    'SASA_fst_v2_c': lambda: FeatureSpec(embedder, SASA=True),
+
+    'nei_emb_3_v2_c': lambda: FeatureSpec(embedder, aggregation='concat', neighbors_count=3),
+
+    'nei_emb_5_avrg_v2_c': lambda: FeatureSpec(embedder, aggregation='average', neighbors_count=5),
+
+    'nei_emb_3_avrg_v2_c': lambda: FeatureSpec(embedder, aggregation='average', neighbors_count=3),
+
+    'two_prot_v2_c': lambda: FeatureSpec(embedder, protrusion_radii=[8.5, args.second_radius]),
+}[args.final_tag]()
+
+print (f'features: {feature_spec} (hash {feature_spec.hash()})', flush=True)
+
+
+
+X_train_validate, y_train_validate, X_test, y_test, train_offsets, test_offsets = ds.get_train_test_data(
+    [feature_spec.compile()],
+    filters=[dataset.Helpers.filter_chains_with_valid_3D_file],
+    feature_store=feature_store,
+    return_offsets=True
 )
 
 def get_model():
@@ -131,20 +116,6 @@ def get_model():
     model.set_verbose()
     return model
 
-split_random = random.Random()
-split_random.seed(42)
-
-def split_data(X, y): 
-    combined = list(zip(X, y))
-    split_random.shuffle(combined)
-    X_s, y_s = zip(*combined)
-    
-    half = len(X_s) // 2
-
-    return \
-        np.array(X_s[:half]), np.array(X_s[half:]), \
-        np.array(y_s[:half]), np.array(y_s[half:])
-
 def get_results(y_true, y_pred):
     y_true, y_pred = np.array(y_true), np.array(y_pred)
     y_pred_class = (y_pred >= hyper_params['threshold']).astype(int)
@@ -164,33 +135,75 @@ def get_results(y_true, y_pred):
 
 print('running 10 2-cross validations...')
 
-all_X = np.concatenate((X_train_validate, X_test), axis=0)
-all_y = np.concatenate((y_train_validate, y_test), axis=0)
+# the matrix lives in shared memory, workers receive only its handle and the indexes of the folds
+shared_X = SharedArray.concatenate([X_train_validate, X_test])
+shared_y = SharedArray.concatenate([y_train_validate, y_test])
+
+fold_data = {}
+
+def attach_fold_data(shared_X, shared_y, worker_threads=None):
+    fold_data['X'] = shared_X.attach()
+    fold_data['y'] = shared_y.attach()
+
+    if worker_threads is not None:
+        # forked workers must not use CUDA, the folds are trained on CPU cores split among the workers
+        torch.set_num_threads(worker_threads)
+        fold_data['device'] = 'cpu'
+
+def fold_seed(fold):
+    # the same seed for a fold regardless of the number of workers and the order of execution
+    return int(np.random.SeedSequence([hyper_params['seed'], fold]).generate_state(1)[0])
+
+def run_fold(fold_task):
+    fold, train_indexes, test_indexes = fold_task
+    X, y = fold_data['X'], fold_data['y']
 
-_2cv_results = []
+    seed_all(fold_seed(fold))
 
-for iter in range(10):
-    print('\n... running iteration ', iter , '\n')
-    X1, X2, y1, y2 = split_data(all_X, all_y)
+    print (f'initializing network (fold {fold}) ...', flush=True)
+    model = get_model()
 
-    for X_train_2cv, X_test_2cv, y_train_2cv, y_test_2cv in [[X1, X2, y1, y2], [X2, X1, y2, y1]]:
-        print ('initializing network ...', flush=True)
-        model = get_model()
+    if 'device' in fold_data:
+        model.device = fold_data['device']
 
-        print ('fitting ...', flush=True)
-        model.fit(X_train_2cv, y_train_2cv)
+    print (f'fitting (fold {fold}) ...', flush=True)
+    model.fit(X, y, indices=train_indexes)
 
-        print ('predicting ...', flush=True)
-        pred_y = model.predict(X_test_2cv)
+    print (f'predicting (fold {fold}) ...', flush=True)
+    pred_y = model.predict(X, indices=test_indexes)
 
-        fold_result = get_results(y_test_2cv, pred_y)
-        _2cv_results.append(fold_result)
+    fold_result = get_results(y[test_indexes], pred_y)
 
-        print (f'   [mcc = {fold_result["mcc"]:.3f}]')
+    print (f'   [mcc (fold {fold}) = {fold_result["mcc"]:.3f}]', flush=True)
+    return fold_result
+
+# splits are always created in the same order by the main process
+if args.group_by_chain:
+    fold_tasks = list(repeated_grouped_2fold_indexes(concatenate_offsets(train_offsets, test_offsets), iterations=10, seed=42))
+else:
+    fold_tasks = list(repeated_2fold_indexes(len(X_train_validate) + len(X_test), iterations=10, seed=42))
+
+try:
+    if args.workers > 1:
+        worker_threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+        with multiprocessing.get_context('fork').Pool(
+                args.workers, 
+                initializer=attach_fold_data, initargs=(shared_X, shared_y, worker_threads)) as pool:
+            
+            _2cv_results = pool.map(run_fold, fold_tasks, chunksize=1)
+    else:
+        attach_fold_data(shared_X, shared_y)
+        _2cv_results = [run_fold(fold_task) for fold_task in fold_tasks]
+finally:
+    fold_data.clear()
+    shared_X.unlink()
+    shared_y.unlink()
 
 print ('running network for on entire train data...')
 
 print ('initializing network ...', flush=True)
+seed_all(hyper_params['seed'])
 model = get_model()
 
 print ('fitting')
@@ -204,6 +217,9 @@ final_result = get_results(y_test, y_pred)
 if args.second_radius:
     hyper_params['tag'] = hyper_params['tag'] + f'__{args.second_radius * 10:2.0f}'
 
+if args.group_by_chain:
+    hyper_params['tag'] = hyper_params['tag'] + '__chains'
+
 report = {
     '2cv_results': _2cv_results,
     'final_result': final_result,
@@ -0,0 +1,174 @@
+import argparse
+from datetime import datetime
+from itertools import product
+import json
+import os
+import random
+import sys
+
+import numpy as np
+from sklearn.model_selection import train_test_split
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import config.config as config
+from estimators.basic import BasicNetwork
+from estimators.sweep import SweepTrainer
+import data_prep.datasets_db as dataset
+import data_prep.pdb_files_db as pdb_data
+from data_prep.feature_store import FeatureStore
+from data_prep.shared_datasets import SharedDatasets
+from evaluator import get_statistics
+import string
+from seed_network import seed_all
+
+# trains all combinations of the hidden layers and learning rates in one process (see `SweepTrainer`),
+# writes the same result files as `network.v2.py` (one per combination)
+
+allowed_ligands = dataset.SeqDatasetDb.all_ligands()
+allowed_embedder = ['ESM']
+
+parser = argparse.ArgumentParser(description='Ligand binding sites neural networks sweep')
+
+# python /home/brabecm4/diplomka/protein-binding-sites/netws/network.sweep.py --verbose True --seed 42 --learning-rates 0.01 0.001 0.0001 --epochs 120 --batch-size 1000 --embedder ESM --epoch-stats-interval 10 --tag test --hidden-layers 256-256-32 1024-512-512-256 --ligand FE
+
+parser.add_argument('--tag', type=str, help='Tag the final result', required=True)
+parser.add_argument('--ligand', type=str, choices=allowed_ligands, help='Name of the ligand')
+parser.add_argument('--embedder', type=str, choices=allowed_embedder, help='Embedder to be used.')
+parser.add_argument('--hidden-layers', type=str, nargs='+', help='List of hidden layer configurations (sizes separated by "-", e.g. 256-256-32)')
+parser.add_argument('--learning-rates', type=float, nargs='+', help='List of learning rates')
+parser.add_argument('--batch-size', type=int, help='Size of one batch')
+parser.add_argument('--epochs', type=int, help='Number of epochs')
+parser.add_argument('--epoch-stats-interval', type=int, help='Interval of gathering statistics.')
+parser.add_argument('--seed', type=int, help='Seed of random.')
+parser.add_argument('--verbose', type=bool, default=False, help='Print intermediate results.')
+parser.add_argument('--shared-datasets', action='store_true', help='Share the feature matrices in memory with other jobs on the node.')
+
+args = parser.parse_args()
+print('args: ', args)
+
+args.verbose = True if args.verbose else False
+
+seed_all(args.seed)
+
+def generate_random_string(length):
+    letters = string.ascii_letters + string.digits
+    return ''.join(random.choice(letters) for _ in range(length))
+
+print ('loading data ...', flush=True)
+
+pdb_db = pdb_data.PdbFilesDb()
+
+db = dataset.SeqDatasetDb()
+db.set_pdb_db(pdb_db)
+feature_store = FeatureStore()
+shared_datasets = SharedDatasets() if args.shared_datasets else None
+
+ds = db.get_dataset_for(args.ligand)
+
+print ('defining training and testing data ...', flush=True)
+
+X_train_validate, y_train_validate, X_test, y_test = ds.get_train_test_data(
+    [
+        dataset.DataAccessors.embeddings(args.embedder),
+    ],
+
+     filters=[dataset.Helpers.filter_chains_with_valid_3D_file],
+     feature_store=feature_store,
+     shared_datasets=shared_datasets
+)
+
+# the split is made by indexes, the estimators read the rows from the (possibly shared) matrix itself
+train_indexes, validate_indexes = train_test_split(
+    np.arange(len(y_train_validate)), train_size=0.8, random_state=args.seed)
+
+print ('initializing networks ...', flush=True)
+
+configurations = [
+    { 'hidden_layers': [int(size) for size in hidden_layers.split('-')], 'learning_rate': learning_rate }
+    for hidden_layers, learning_rate in product(args.hidden_layers, args.learning_rates)
+]
+
+def get_stats(model, epoch):
+    if (args.verbose):
+        print (f'validation data stats ({model.get_name()}):')
+
+    stats = get_statistics(model,
+                            X_train_validate, y_train_validate,
+                            epoch, print_res=args.verbose, indices=validate_indexes)
+
+    if (args.verbose):
+        print (f'test data stats ({model.get_name()}):')
+
+    stats['test_data_stats'] = get_statistics(model,
+                               X_test, y_test,
+                               epoch, print_res=args.verbose)
+
+    return stats
+
+def create_epoch_callback(all_stats, losses):
+    def epoch_callback(epoch, loss, model):
+        if (args.verbose):
+            print(f'Epoch: {epoch}, loss ({model.get_name()}): {loss :.5f}', flush=True)
+
+        losses.append(float(loss))
+
+        if (epoch % args.epoch_stats_interval == 0):
+            model.optimize_threshold_for_mcc(X_train_validate, y_train_validate, indices=train_indexes)
+
+            all_stats.append(get_stats(model, epoch))
+
+    return epoch_callback
+
+models = []
+
+for configuration in configurations:
+    model = BasicNetwork(batch_size=args.batch_size,
+                         input_size=X_train_validate.shape[1],
+                         hidden_sizes=configuration['hidden_layers'],
+                         epochs=args.epochs,
+                         learning_rate=configuration['learning_rate'])
+
+    model.set_name(f'hl{"-".join([str(n) for n in configuration["hidden_layers"]])}_lr{configuration["learning_rate"]}')
+
+    configuration['all_stats'] = []
+    configuration['losses'] = []
+    model.register_epoch_callback(create_epoch_callback(configuration['all_stats'], configuration['losses']))
+
+    models.append(model)
+
+sweep = SweepTrainer(models)
+
+if (args.verbose):
+    sweep.set_verbose()
+
+print (f'fitting {len(models)} networks ...', flush=True)
+sweep.fit(X_train_validate, y_train_validate, indices=train_indexes)
+
+for model, configuration in zip(models, configurations):
+    final_stats = get_stats(model, args.epochs)
+
+    training_report = {
+        'result_tag': args.tag,
+        'ligand': args.ligand,
+        'embedder': args.embedder,
+        'model_to_string': str(model.underling_model()),
+        'batch_size': args.batch_size,
+        'total_epochs': args.epochs,
+        'seed': args.seed,
+        'learning_rate': configuration['learning_rate'],
+        'hidden_layers': configuration['hidden_layers'],
+        'all_stats': configuration['all_stats'],
+        'final_stats': final_stats,
+        'losses': configuration['losses'],
+        'radius': None
+    }
+
+    result_file_name = f'{args.ligand}_hl{"-".join([str(n) for n in configuration["hidden_layers"]])}.{datetime.now().strftime("%d-%m-%y-%Hh%Mm%Ss.%f")}.{generate_random_string(5)}.json'
+    result_path = os.path.join(config.networks_results_folder, result_file_name)
+
+    with open(result_path, 'w') as file:
+        json.dump(training_report, file, indent=2)
+
+    print ('report: ', training_report)
+
+if (args.verbose):
+    print('successfully finished', flush=True)
@@ -5,6 +5,7 @@ import os
 import random
 import sys
 
+import numpy as np
 from sklearn.model_selection import train_test_split
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
 import config.config as config
@@ -12,6 +13,8 @@ from estimators.basic import BasicNetwork
 from estimators.bypass import BypassedInputsNetwork
 import data_prep.datasets_db as dataset
 import data_prep.pdb_files_db as pdb_data
+from data_prep.feature_store import FeatureStore
+from data_prep.shared_datasets import SharedDatasets
 from evaluator import get_statistics
 import string
 from seed_network import seed_all 
@@ -35,6 +38,7 @@ parser.add_argument('--seed', type=int, help='Seed of random.')
 parser.add_argument('--learning-rate', type=float, help='Learning rate')
 parser.add_argument('--radius', type=float, help='Learning rate')
 parser.add_argument('--verbose', type=bool, default=False, help='Print intermediate results.')
+parser.add_argument('--shared-datasets', action='store_true', help='Share the feature matrices in memory with other jobs on the node.')
 
 args = parser.parse_args()
 print('args: ', args)
@@ -57,6 +61,8 @@ pdb_db = pdb_data.PdbFilesDb()
 
 db = dataset.SeqDatasetDb()
 db.set_pdb_db(pdb_db)
+feature_store = FeatureStore()
+shared_datasets = SharedDatasets() if args.shared_datasets else None
 
 ds = db.get_dataset_for(args.ligand)
 
@@ -93,22 +99,25 @@ X_train_validate, y_train_validate, X_test, y_test = ds.get_train_test_data(
         # dataset.DataAccessors.SASA_vector(),
     ],
 
-     filters=[dataset.Helpers.filter_chains_with_valid_3D_file]
+     filters=[dataset.Helpers.filter_chains_with_valid_3D_file],
+     feature_store=feature_store,
+     shared_datasets=shared_datasets
 )
 
-X_train, X_validate, y_train, y_validate = train_test_split(
-    X_train_validate, y_train_validate, train_size=0.8, random_state=args.seed)
+# the split is made by indexes, the estimators read the rows from the (possibly shared) matrix itself
+train_indexes, validate_indexes = train_test_split(
+    np.arange(len(y_train_validate)), train_size=0.8, random_state=args.seed)
 
 print ('initializing network ...', flush=True)
 
 model = BasicNetwork(batch_size=args.batch_size, 
-                     input_size=len(X_train[0]),
+                     input_size=X_train_validate.shape[1],
                      hidden_sizes=args.hidden_layers,
                      epochs=args.epochs,
                      learning_rate=args.learning_rate)
 
 # model = BypassedInputsNetwork(batch_size=args.batch_size, 
-#                      input_size=len(X_train[0]),
+#                      input_size=X_train_validate.shape[1],
 #                      hidden_sizes=args.hidden_layers,
 #                      epochs=args.epochs,
 #                      learning_rate=args.learning_rate,
@@ -121,9 +130,9 @@ def get_stats(model, epoch):
     if (args.verbose):
         print ('validation data stats:')
 
-    stats = get_statistics(model, 
-                            X_validate, y_validate, 
-                            epoch, print_res=args.verbose)
+    stats = get_statistics(model,
+                            X_train_validate, y_train_validate,
+                            epoch, print_res=args.verbose, indices=validate_indexes)
     
     if (args.verbose):
         print ('test data stats:')
@@ -141,14 +150,14 @@ def epoch_callback(epoch, loss, model):
     losses.append(float(loss))
 
     if (epoch % args.epoch_stats_interval == 0):
-        model.optimize_threshold_for_mcc(X_train, y_train)
+        model.optimize_threshold_for_mcc(X_train_validate, y_train_validate, indices=train_indexes)
 
         all_stats.append(get_stats(model, epoch))
 
 model.register_epoch_callback(epoch_callback)
 
 print ('fitting ...', flush=True)
-model.fit(X_train, y_train)
+model.fit(X_train_validate, y_train_validate, indices=train_indexes)
 
 print ('predicting ...', flush=True)
 model.predict(X_test)